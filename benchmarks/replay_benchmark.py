@@ -0,0 +1,176 @@
+"""
+Benchmark of the genetic algorithm without Prolog: the evaluations are
+replayed (ReplayBackend) from a recording made with --record-file, or
+get deterministic synthetic scores if no recording is given. It checks
+that two runs with the same seed are identical, that the number of
+evaluations matches the ones served by the backend, that the injected
+latency is accounted for, and that the throughput of run_genetic_loop
+and of the operators stays above the given minimums.
+Usage: python benchmarks/replay_benchmark.py [--recording FILE] [--latency SECONDS] ...
+Exits with 1 if a check fails.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ellepi.api import build_atoms, learn
+from ellepi.argparser import get_arguments
+from ellepi.genetic import GeneticAlgorithm, GeneticOptions
+from ellepi.replay import ReplayBackend, new_recording
+
+# modes of the synthetic recording
+SYNTHETIC_MODES = (
+    [["p", "+", "+"]],
+    [["q", "+", "-"], ["r", "+"], ["s", "-", "+"], ["t", "+", "+"], ["u", "+"]]
+)
+
+
+def parse_args():
+    """
+    Arguments parser.
+    """
+    command_parser = argparse.ArgumentParser(
+        description="Replay benchmark",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    command_parser.add_argument(
+        "--recording",
+        help="Recording made with ellepi --record-file (default: synthetic scores).",
+        type=str,
+        default=""
+    )
+    command_parser.add_argument(
+        "--latency",
+        help="Latency (seconds) injected for each evaluated program.",
+        type=float,
+        default=0
+    )
+    command_parser.add_argument(
+        "--cycles",
+        help="Evolutionary cycles.",
+        type=int,
+        default=200
+    )
+    command_parser.add_argument(
+        "--popsize",
+        help="Population size.",
+        type=int,
+        default=20
+    )
+    command_parser.add_argument(
+        "--pairs",
+        help="Pairs of parents per iteration.",
+        type=int,
+        default=4
+    )
+    command_parser.add_argument(
+        "--min-throughput",
+        help="Minimum number of evaluations per second of run_genetic_loop (0: no check).",
+        type=float,
+        default=0
+    )
+    command_parser.add_argument(
+        "--max-overhead",
+        help="Maximum time (seconds) spent by the algorithm per evaluation, excluding the injected latency (0: no check).",
+        type=float,
+        default=0.01
+    )
+    command_parser.add_argument(
+        "--min-offspring-rate",
+        help="Minimum number of offspring per second generated by the operators (0: no check).",
+        type=float,
+        default=200
+    )
+    command_parser.add_argument(
+        "--seed",
+        type=int,
+        default=42
+    )
+    return command_parser.parse_args()
+
+
+def get_backend(args) -> ReplayBackend:
+    if args.recording != "":
+        return ReplayBackend.from_file(args.recording, latency=args.latency)
+    return ReplayBackend(new_recording(*SYNTHETIC_MODES), latency=args.latency)
+
+
+def run(args, **options) -> 'tuple[ReplayBackend, object, float]':
+    """
+    Runs the algorithm on a new backend, returns the backend, the
+    result, and the elapsed time.
+    """
+    backend = get_backend(args)
+    start_time = time.perf_counter()
+    result = learn(
+        prolog_int=backend,
+        test=False,
+        evolutionary_cycles=args.cycles,
+        popsize=args.popsize,
+        obs=args.pairs,
+        seed=args.seed,
+        **options
+    )
+    return backend, result, time.perf_counter() - start_time
+
+
+def time_operators(args, iterations : int = 50, **options) -> float:
+    """
+    Offspring generated per second by selection, crossover, and
+    mutation (no evaluation).
+    """
+    backend = get_backend(args)
+    atoms_head, atoms_body = build_atoms(backend, 2)
+    genetic_options = GeneticOptions.from_kwargs(popsize=args.popsize, obs=args.pairs, seed=args.seed, **options)
+    genetic_alg = GeneticAlgorithm(atoms_head, atoms_body, backend, genetic_options)
+    n_offspring = 0
+    start_time = time.perf_counter()
+    for it in range(iterations):
+        genetic_alg.iteration = it
+        n_offspring += len(genetic_alg._generate_offspring())
+    return n_offspring / (time.perf_counter() - start_time)
+
+
+def main():
+    """
+    Main method.
+    """
+    args = parse_args()
+    failures : 'list[str]' = []
+
+    for name, options in [("sequential operators", {}), ("batch operators", {"batch_operators" : True})]:
+        backend, result, elapsed = run(args, **options)
+        backend_again, result_again, _ = run(args, **options)
+        evaluations = result.statistics["evaluations"]
+        throughput = backend.evaluations / elapsed
+        overhead = (elapsed - backend.evaluations * args.latency) / backend.evaluations
+        offspring_rate = time_operators(args, **options)
+        print(f"{name}: {elapsed:.3f} s, {evaluations} evaluations ({backend.evaluations} served by the backend, {backend.misses} not recorded), {throughput:.1f} evaluations/s, overhead {overhead * 1000:.3f} ms/evaluation, operators {offspring_rate:.0f} offspring/s, best score {result.best_individual.score}")
+
+        if result.program != result_again.program or backend.evaluations != backend_again.evaluations:
+            failures.append(f"{name}: two runs with the same seed differ")
+        # the initial available rules (all distinct, the rules are not
+        # normalised) and the final LL on the training set are evaluated
+        # outside the loop
+        expected = evaluations + get_arguments().rtg + 1
+        if backend.evaluations != expected:
+            failures.append(f"{name}: {backend.evaluations} evaluations served by the backend, expected {expected}")
+        if elapsed < backend.evaluations * args.latency:
+            failures.append(f"{name}: the injected latency is not accounted for")
+        if args.max_overhead > 0 and overhead > args.max_overhead:
+            failures.append(f"{name}: overhead {overhead:.4f} s per evaluation above {args.max_overhead} s")
+        if args.min_throughput > 0 and throughput < args.min_throughput:
+            failures.append(f"{name}: throughput {throughput:.1f} evaluations/s below {args.min_throughput}")
+        if args.min_offspring_rate > 0 and offspring_rate < args.min_offspring_rate:
+            failures.append(f"{name}: operators {offspring_rate:.0f} offspring/s below {args.min_offspring_rate}")
+
+    for f in failures:
+        print(f"FAILED: {f}")
+    sys.exit(1 if len(failures) > 0 else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Startup time benchmark: checks that importing the package and parsing
+the command line stay under a time budget (measured as overhead over a
+bare Python interpreter) and that they do not load the heavy modules
+(numpy, janus_swi).
+Usage: python benchmarks/startup_time.py [--budget SECONDS] [--runs N]
+Exits with 1 if a check fails.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+HEAVY_MODULES = ["numpy", "janus_swi"]
+
+CHECK_MODULES = """
+import sys
+loaded = [m for m in {heavy} if m in sys.modules]
+if len(loaded) > 0:
+    print("loaded: " + ' '.join(loaded))
+    sys.exit(2)
+"""
+
+SNIPPETS = {
+    "python" : "pass",
+    "import ellepi" : "import ellepi" + CHECK_MODULES,
+    "argument parsing" : "from ellepi.argparser import parse_args\nparse_args(['-f', 'x'])" + CHECK_MODULES,
+    "ellepi --help" : "import sys\nsys.argv = ['ellepi', '--help']\nimport ellepi\ntry:\n    ellepi.main()\nexcept SystemExit:\n    pass" + CHECK_MODULES,
+}
+
+
+def parse_args():
+    """
+    Arguments parser.
+    """
+    command_parser = argparse.ArgumentParser(
+        description="Startup time benchmark",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    command_parser.add_argument(
+        "--budget",
+        help="Maximum overhead (seconds) over the bare interpreter.",
+        type=float,
+        default=0.15
+    )
+    command_parser.add_argument(
+        "--runs",
+        help="Number of runs, the best one is considered.",
+        type=int,
+        default=5
+    )
+    return command_parser.parse_args()
+
+
+def run_snippet(code : str, runs : int) -> 'tuple[float, int, str]':
+    """
+    Best wall clock time of running code in a new interpreter, with the
+    return code and the output of the last run.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env["PYTHONPATH"] = root + os.pathsep + env.get("PYTHONPATH", "")
+    best = float("inf")
+    res = None
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        res = subprocess.run([sys.executable, "-c", code], env=env, capture_output=True, text=True)
+        best = min(best, time.perf_counter() - start_time)
+    return best, res.returncode, (res.stdout + res.stderr).strip()
+
+
+def main():
+    """
+    Main method.
+    """
+    args = parse_args()
+    failed = False
+    baseline = 0.0
+    for name, code in SNIPPETS.items():
+        elapsed, returncode, output = run_snippet(code.format(heavy=HEAVY_MODULES), args.runs)
+        if name == "python":
+            baseline = elapsed
+            print(f"{name}: {elapsed:.4f} s")
+            continue
+        overhead = elapsed - baseline
+        status = "ok"
+        if returncode != 0:
+            status = f"FAILED ({output.splitlines()[-1] if output else returncode})"
+            failed = True
+        elif overhead > args.budget:
+            status = f"FAILED (budget {args.budget} s)"
+            failed = True
+        print(f"{name}: {elapsed:.4f} s, overhead {overhead:.4f} s: {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
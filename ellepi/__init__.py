@@ -1,4 +1,28 @@
-from . import ellepi
+import importlib
+
+# the public names are imported on first use (PEP 562), so importing the
+# package (or running ellepi --help) does not load numpy or SWI-Prolog
+_LAZY_ATTRIBUTES = {
+    "learn" : ".api",
+    "LearningResult" : ".api",
+    "GeneticOptions" : ".genetic",
+    "GeneticAlgorithm" : ".genetic",
+    "PrologInterface" : ".prolog_interface",
+    "RecordingBackend" : ".replay",
+    "ReplayBackend" : ".replay",
+}
+
+def __getattr__(name : str):
+    if name in _LAZY_ATTRIBUTES:
+        return getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+    try:
+        # submodules, for example ellepi.ellepi
+        return importlib.import_module(f".{name}", __name__)
+    except ModuleNotFoundError as e:
+        if e.name != f"{__name__}.{name}":
+            raise
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}") from None
 
 def main():
-    ellepi.main()
\ No newline at end of file
+    from .ellepi import main as ellepi_main
+    ellepi_main()
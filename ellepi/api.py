@@ -0,0 +1,102 @@
+from .argparser import get_arguments
+from .genetic import GeneticOptions, GeneticAlgorithm, Individual
+from .prolog_interface import PrologInterface
+from .variable_placer import Atom
+
+
+class LearningResult:
+    """
+    Result of learn(): the best individual, its metrics, and the
+    statistics of the run.
+    """
+    def __init__(self,
+            best_individual : Individual,
+            ll_train : float,
+            statistics : 'dict[str, float]'
+        ) -> None:
+        self.best_individual = best_individual
+        self.program : str = best_individual.get_individual_as_input_program()
+        self.ll_train = ll_train
+        self.statistics = statistics
+        # filled if the test is computed
+        self.learned_program : str = ""
+        self.ll_test : 'float | None' = None
+        self.aucroc : 'float | None' = None
+        self.aucpr : 'float | None' = None
+
+    def __str__(self) -> str:
+        s = f"Best individual:\n{self.best_individual}LL on training: {self.ll_train}\n"
+        if self.ll_test is not None:
+            s += f"Learned program: {self.learned_program}\nLL test: {self.ll_test}\nAUCROC: {self.aucroc}\nAUCPR: {self.aucpr}\n"
+        return s
+    def __repr__(self) -> str:
+        return self.__str__()
+
+
+def build_atoms(prolog_int : PrologInterface, nvars : int) -> 'tuple[list[Atom], list[Atom]]':
+    """
+    Head and body atoms from the modes of the background knowledge.
+    """
+    modeh, modeb = prolog_int.get_modes()
+
+    atoms_head : 'list[Atom]' = []
+    atoms_body : 'list[Atom]' = []
+
+    for atom in modeh:
+        # to remove everything after -/+
+        cleaned_arguments: 'list[str]' = [a[0] for a in atom[1:]]
+        atoms_head.append(Atom(atom[0], cleaned_arguments, nvars))
+
+    for atom in modeb:
+        cleaned_arguments = [a[0] for a in atom[1:]]
+        atoms_body.append(Atom(atom[0], cleaned_arguments, nvars))
+
+    return atoms_head, atoms_body
+
+
+def learn(
+        bg : str = "",
+        bg_text : str = "",
+        prolog_int : 'PrologInterface | None' = None,
+        test : bool = True,
+        **kwargs
+    ) -> LearningResult:
+    """
+    Learns a program without going through the command line.
+    The background knowledge is read from the file bg, or taken from
+    the string bg_text, or it is the one of an already built
+    prolog_int. The other options are given as keyword arguments, named
+    as the attributes of the parsed command line arguments (for example
+    popsize=20, evolutionary_cycles=100, train=["1","2"], test=["3"]).
+    If test is True, the best program is also evaluated on the test
+    folds.
+    """
+    args = get_arguments(**kwargs)
+
+    if prolog_int is None:
+        prolog_int = PrologInterface(
+            bg,
+            args.backend,
+            args.verbosity,
+            bg_text=bg_text,
+            stack_limit=args.stack_limit,
+            table_space=args.table_space,
+            seed=args.seed
+        )
+
+    atoms_head, atoms_body = build_atoms(prolog_int, args.nvars)
+    genetic_alg = GeneticAlgorithm(atoms_head, atoms_body, prolog_int, GeneticOptions(args))
+    best_individual = genetic_alg.run_genetic_loop()
+
+    ir = best_individual.get_individual_as_input_program()
+    ll_train = prolog_int.compute_ll_rules([ir], args.train)[0][0]
+    result = LearningResult(best_individual, ll_train, genetic_alg.statistics)
+
+    if test:
+        program, ll_test, aucroc, aucpr = prolog_int.compute_test_results(ir, args.train, args.test)
+        result.learned_program = program
+        result.ll_test = ll_test
+        result.aucroc = aucroc
+        result.aucpr = aucpr
+
+    return result
@@ -1,6 +1,6 @@
 import argparse
 
-def parse_args():
+def get_parser() -> argparse.ArgumentParser:
     """
     Arguments parser.
     """
@@ -13,9 +13,9 @@ def parse_args():
     command_parser.add_argument(
         "-f",
         "--filename",
-        help="Program to analyse",
+        help="Program to analyse (not needed with --replay-file)",
         type=str,
-        required=True
+        default=""
     )
     command_parser.add_argument(
         "-v",
@@ -31,11 +31,90 @@ def parse_args():
         default="SLIPCOVER"
     )
 
+    command_parser.add_argument(
+        "--log-file",
+        help="File for the structured log of the run (JSON lines, render it with ellepi-render-log). With it, the individuals printed with verbosity >= 2 are logged instead.",
+        type=str,
+        default=""
+    )
+    command_parser.add_argument(
+        "--log-sample-rate",
+        help="Fraction of the events about single individuals to log.",
+        type=float,
+        default=1.0
+    )
+    command_parser.add_argument(
+        "--log-rate-limit",
+        help="Maximum number of events about single individuals logged per second (0: no limit).",
+        type=int,
+        default=0
+    )
+    command_parser.add_argument(
+        "--record-file",
+        help="File where the results of the Prolog queries (LL and probabilities of each program, modes, coverage) are recorded, to be replayed with --replay-file.",
+        type=str,
+        default=""
+    )
+    command_parser.add_argument(
+        "--replay-file",
+        help="Run without Prolog, replaying the results recorded with --record-file (the programs not recorded get a deterministic synthetic score).",
+        type=str,
+        default=""
+    )
+    command_parser.add_argument(
+        "--replay-latency",
+        help="Latency (seconds) injected for each program evaluated with --replay-file.",
+        type=float,
+        default=0
+    )
+    command_parser.add_argument(
+        "--replay-latency-scale",
+        help="With --replay-file, each program also costs its recorded learning time multiplied by this factor.",
+        type=float,
+        default=0
+    )
+    command_parser.add_argument(
+        "--stack-limit",
+        help="Limit (MB) of the Prolog stacks (0: default of SWI-Prolog).",
+        type=int,
+        default=0
+    )
+    command_parser.add_argument(
+        "--table-space",
+        help="Limit (MB) of the Prolog table space (0: default of SWI-Prolog).",
+        type=int,
+        default=0
+    )
+    command_parser.add_argument(
+        "--max-rss",
+        help="Memory (MB) above which caches are emptied and the population is reduced (0: no limit).",
+        type=int,
+        default=0
+    )
+    command_parser.add_argument(
+        "--gc-step",
+        help="Run the Prolog garbage collection (stacks, atoms, clauses) every this number of iterations (0: never).",
+        type=int,
+        default=0
+    )
+    command_parser.add_argument(
+        "--memory-check-step",
+        help="Sample the memory every this number of iterations (with --max-rss or --gc-step).",
+        type=int,
+        default=10
+    )
     command_parser.add_argument(
         "--seed",
         help="Seed for the random generator",
+        type=int,
         default=42
     )
+    command_parser.add_argument(
+        "--workers",
+        help="Number of worker processes (each one with a Prolog engine) for the evaluation.",
+        type=int,
+        default=1
+    )
     command_parser.add_argument(
         "--train",
         help="Ids for the training set",
@@ -126,17 +205,150 @@ def parse_args():
         type=float,
         default=0.8
     )
+    command_parser.add_argument(
+        "-obs",
+        help="Number of pairs of parents selected at each iteration.",
+        type=int,
+        default=1
+    )
+    command_parser.add_argument(
+        "-bops",
+        "--batch-operators",
+        help="Apply crossover and mutation to all the selected parents at once (vectorised, seeded with --seed).",
+        action="store_true"
+    )
+    command_parser.add_argument(
+        "-ws",
+        "--warm-start",
+        help="Start parameter learning of the offspring from the probabilities learned for the parents.",
+        action="store_true"
+    )
+    command_parser.add_argument(
+        "-cov",
+        "--coverage-index",
+        help="Precompute the coverage of the atoms on the training examples and discard the offspring that cannot cover positive examples.",
+        action="store_true"
+    )
+    command_parser.add_argument(
+        "-norm",
+        "--normalise-rules",
+        help="Rename the variables of the rules in order of first occurrence, so alpha-equivalent rules and programs are the same, and cache the scores of the programs.",
+        action="store_true"
+    )
+    command_parser.add_argument(
+        "-aos",
+        "--adaptive-operators",
+        help="Adapt the probabilities of the mutations (-par, -pdr, -pm, -pcatom, -pcinst) and of the crossover types during the run, according to the score gain per evaluation of their offspring.",
+        action="store_true"
+    )
+    command_parser.add_argument(
+        "-aoa",
+        help="Adaptation rate of the adaptive operator rates (weight of the last reward in the quality of an operator).",
+        type=float,
+        default=0.3
+    )
+    command_parser.add_argument(
+        "-aomin",
+        help="Minimum share of the probability given to each crossover type with the adaptive operator rates.",
+        type=float,
+        default=0.05
+    )
+    command_parser.add_argument(
+        "-aof",
+        help="With the adaptive operator rates, each mutation probability stays within a factor -aof of the configured one.",
+        type=float,
+        default=2
+    )
     command_parser.add_argument(
         "-age",
         help="Probability to drop the oldest element.",
         type=float,
         default=-1.0
     )
+    command_parser.add_argument(
+        "-repl",
+        "--replacement",
+        help="Replacement strategy: drop the worst (or the oldest, with -age), drop the worst shared fitness, or deterministic crowding.",
+        type=str,
+        default="worst",
+        choices=["worst","sharing","crowding"]
+    )
+    command_parser.add_argument(
+        "-sr",
+        help="Fitness sharing: niche radius (Jaccard distance between rule sets, at most 1).",
+        type=float,
+        default=0.5
+    )
+    command_parser.add_argument(
+        "-sa",
+        help="Fitness sharing: exponent of the sharing function.",
+        type=float,
+        default=1.0
+    )
     command_parser.add_argument(
         "-r",
         help="Regularization.",
         type=float,
         default=0
     )
+    command_parser.add_argument(
+        "-surr",
+        "--surrogate",
+        help="Use a surrogate model to skip the evaluation of the offspring predicted to be poor.",
+        action="store_true"
+    )
+    command_parser.add_argument(
+        "-skf",
+        help="Surrogate: fraction of the offspring to evaluate.",
+        type=float,
+        default=0.5
+    )
+    command_parser.add_argument(
+        "-smin",
+        help="Surrogate: number of evaluated individuals before starting to filter.",
+        type=int,
+        default=50
+    )
     
-    return command_parser.parse_args()
+    return command_parser
+
+
+def parse_args(argv : 'list[str] | None' = None) -> argparse.Namespace:
+    """
+    Parses the command line arguments (sys.argv if argv is None).
+    The filename is required unless the run is replayed.
+    """
+    command_parser = get_parser()
+    args = command_parser.parse_args(argv)
+    if args.filename == "" and args.replay_file == "":
+        command_parser.error("the following arguments are required: -f/--filename (unless --replay-file is given)")
+    return args
+
+
+def get_arguments(**kwargs) -> argparse.Namespace:
+    """
+    Arguments with the default values of the command line, overridden
+    by kwargs, whose names are the ones of the attributes of the parsed
+    arguments (for example popsize, evolutionary_cycles, par, seed).
+    The values are converted and checked as on the command line (type
+    and choices), raising ValueError. The filename is not required.
+    """
+    command_parser = get_parser()
+    args = command_parser.parse_args([])
+    actions = {a.dest : a for a in command_parser._actions if a.dest != "help"}
+    for k, value in kwargs.items():
+        if k not in actions:
+            raise ValueError(f"Unknown option: {k}")
+        action = actions[k]
+        values = value if action.nargs in ["+", "*"] else [value]
+        if action.type is not None:
+            try:
+                values = [action.type(v) for v in values]
+            except (TypeError, ValueError):
+                raise ValueError(f"Invalid value for {k}: {value!r}") from None
+        if action.choices is not None:
+            for v in values:
+                if v not in action.choices:
+                    raise ValueError(f"Invalid value for {k}: {v!r} (choose from {', '.join(map(str, action.choices))})")
+        setattr(args, k, values if action.nargs in ["+", "*"] else values[0])
+    return args
@@ -0,0 +1,165 @@
+import numpy as np
+
+from .variable_placer import Atom
+
+# Array encoding of a block of individuals.
+# rules: int array of shape (n_individuals, max_rules, 2 + 2*max_body),
+# where each rule is [head atom, head instantiation, body atom 0,
+# body instantiation 0, body atom 1, ...] and -1 is used for padding
+# (both for missing rules and missing body atoms).
+# n_rules: int array of shape (n_individuals,) with the number of rules
+# of each individual.
+PAD = -1
+
+
+class BatchOperators:
+    """
+    Crossover and mutation applied to a block of individuals at once,
+    working on the array encoding. All the random decisions are drawn
+    together from a numpy Generator, with a number of draws that depends
+    only on the shape of the block, so the result is reproducible for a
+    given seed.
+    """
+    def __init__(self,
+            head_candidates : 'list[Atom]',
+            body_candidates : 'list[Atom]',
+            prob_add_rule : float,
+            prob_drop_rule : float,
+            prob_modify : float,
+            prob_change_atom : float,
+            prob_change_instantiation : float,
+            max_initial_rule_length : int,
+            rng : np.random.Generator
+        ) -> None:
+        self.n_head_instantiations = np.array([len(a.possible_instantiations) for a in head_candidates])
+        self.n_body_instantiations = np.array([len(a.possible_instantiations) for a in body_candidates])
+        self.prob_add_rule = prob_add_rule
+        self.prob_drop_rule = prob_drop_rule
+        self.prob_modify = prob_modify
+        self.prob_change_atom = prob_change_atom
+        self.prob_change_instantiation = prob_change_instantiation
+        self.max_initial_rule_length = max_initial_rule_length
+        self.rng = rng
+        # operators applied to each individual by the last mutate call
+        # (boolean arrays of shape (n_individuals,))
+        self.applied : 'dict[str, np.ndarray]' = {}
+
+    def crossover(self,
+            rules0 : np.ndarray,
+            n_rules0 : np.ndarray,
+            rules1 : np.ndarray,
+            n_rules1 : np.ndarray
+        ) -> 'tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]':
+        """
+        One point crossover between the i-th individual of the first and
+        of the second block, as GeneticAlgorithm._crossover: the child 01
+        takes the rules of 0 before the cut point and the rules of 1 after
+        it (so it has the length of 1), and vice versa.
+        """
+        n = rules0.shape[0]
+        u = self.rng.random((2, n))
+        # cut points in [0, len], then capped by the length of the other
+        cut0 = np.minimum(np.floor(u[0] * (n_rules0 + 1)).astype(np.int64), n_rules1)
+        cut1 = np.minimum(np.floor(u[1] * (n_rules1 + 1)).astype(np.int64), n_rules0)
+
+        positions = np.arange(rules0.shape[1])[None, :]
+        mask01 = (positions < cut0[:, None])[:, :, None]
+        mask10 = (positions < cut1[:, None])[:, :, None]
+        child01 = np.where(mask01, rules0, rules1)
+        child10 = np.where(mask10, rules1, rules0)
+        # clear the slots after the end of each child
+        child01[positions >= n_rules1[:, None]] = PAD
+        child10[positions >= n_rules0[:, None]] = PAD
+
+        return child01, n_rules1.copy(), child10, n_rules0.copy()
+
+    def _generate_rules(self, n : int, max_body : int) -> np.ndarray:
+        """
+        Generates n random rules, as Rule.__init__: random head, random
+        body length, distinct body atoms sorted by index.
+        """
+        n_head = len(self.n_head_instantiations)
+        # as Rule.__init__, the last body atom is not sampled
+        n_body_choices = max(1, len(self.n_body_instantiations) - 1)
+        max_length = min(self.max_initial_rule_length, n_body_choices, max_body)
+
+        u = self.rng.random((n, 3))
+        head_atoms = np.floor(u[:, 0] * n_head).astype(np.int64)
+        head_insts = np.floor(u[:, 1] * self.n_head_instantiations[head_atoms]).astype(np.int64)
+        lengths = 1 + np.floor(u[:, 2] * max_length).astype(np.int64)
+
+        # sampling without replacement: first positions of a random permutation
+        keys = self.rng.random((n, n_body_choices))
+        body_atoms = np.argsort(keys, axis=1)[:, :max_length]
+        body_atoms = np.where(np.arange(max_length)[None, :] < lengths[:, None], body_atoms, np.iinfo(np.int64).max)
+        body_atoms = np.sort(body_atoms, axis=1)
+        valid = body_atoms != np.iinfo(np.int64).max
+        body_atoms = np.where(valid, body_atoms, 0)
+        body_insts = np.floor(self.rng.random((n, max_length)) * self.n_body_instantiations[body_atoms]).astype(np.int64)
+
+        rules = np.full((n, 2 + 2*max_body), PAD, dtype=np.int64)
+        rules[:, 0] = head_atoms
+        rules[:, 1] = head_insts
+        rules[:, 2:2 + 2*max_length:2] = np.where(valid, body_atoms, PAD)
+        rules[:, 3:3 + 2*max_length:2] = np.where(valid, body_insts, PAD)
+        return rules
+
+    def mutate(self, rules : np.ndarray, n_rules : np.ndarray) -> 'tuple[np.ndarray, np.ndarray]':
+        """
+        Applies mutation to all the individuals of the block, as
+        GeneticAlgorithm._mutate: add a rule, drop each rule, modify
+        each rule by changing the atoms or their instantiations.
+        """
+        n, max_rules, width = rules.shape
+        max_body = (width - 2) // 2
+
+        # add a rule: one more slot to store it
+        rules = np.concatenate([rules, np.full((n, 1, width), PAD, dtype=rules.dtype)], axis=1)
+        add = self.rng.random(n) < self.prob_add_rule
+        new_rules = self._generate_rules(n, max_body)
+        rows = np.nonzero(add)[0]
+        rules[rows, n_rules[rows]] = new_rules[rows]
+        n_rules = n_rules + add
+
+        # drop rules: move the kept ones to the front, preserving the order
+        valid = np.arange(max_rules + 1)[None, :] < n_rules[:, None]
+        keep = valid & (self.rng.random((n, max_rules + 1)) >= self.prob_drop_rule)
+        # never drop all the rules: an empty program is not valid
+        keep[:, 0] |= valid[:, 0] & ~keep.any(axis=1)
+        dropped = (valid & ~keep).any(axis=1)
+        order = np.argsort(~keep, axis=1, kind="stable")
+        rules = np.take_along_axis(rules, order[:, :, None], axis=1)
+        n_rules = keep.sum(axis=1)
+        rules[np.arange(max_rules + 1)[None, :] >= n_rules[:, None]] = PAD
+
+        # modify rules
+        atoms = rules[:, :, 2::2]
+        insts = rules[:, :, 3::2]
+        present = atoms != PAD
+        modify = (self.rng.random((n, max_rules + 1)) < self.prob_modify)[:, :, None] & present
+        u = self.rng.random((n, max_rules + 1, max_body))
+        change_atom = modify & (u < self.prob_change_atom)
+        change_inst = modify & ~change_atom & (u < self.prob_change_atom + self.prob_change_instantiation)
+
+        random_atoms = np.floor(self.rng.random(atoms.shape) * len(self.n_body_instantiations)).astype(np.int64)
+        atoms = np.where(change_atom, random_atoms, atoms)
+        random_insts = np.floor(self.rng.random(atoms.shape) * self.n_body_instantiations[np.where(present, atoms, 0)]).astype(np.int64)
+        insts = np.where(change_atom | change_inst, random_insts, insts)
+
+        # keep the body sorted by atom index (padding at the end)
+        sort_key = np.where(present, atoms, np.iinfo(np.int64).max)
+        order = np.argsort(sort_key, axis=2, kind="stable")
+        rules[:, :, 2::2] = np.take_along_axis(atoms, order, axis=2)
+        rules[:, :, 3::2] = np.take_along_axis(insts, order, axis=2)
+
+        self.applied = {
+            "add_rule" : add,
+            "drop_rule" : dropped,
+            "modify" : modify.any(axis=(1, 2)),
+            "change_atom" : change_atom.any(axis=(1, 2)),
+            "change_instantiation" : change_inst.any(axis=(1, 2))
+        }
+
+        # remove the unused trailing slots
+        used = max(1, int(n_rules.max())) if n > 0 else 1
+        return rules[:, :used], n_rules
@@ -0,0 +1,145 @@
+import time
+
+from typing import TYPE_CHECKING
+
+from .variable_placer import Atom
+from .prolog_interface import PrologInterface
+
+if TYPE_CHECKING:
+    from .genetic import Individual, Rule
+
+
+class CoverageIndex:
+    """
+    Precomputed coverage of the possible instantiations of the mode
+    atoms on the examples of the training set. The examples of a head
+    predicate are its groundings true in the models (positive) and its
+    neg/1 facts (negative), and bitsets (python int, the i-th bit is the
+    i-th example of the predicate) store which ones are covered:
+    - for each head instantiation, the examples unifying with it;
+    - for each pair of head and body instantiations (computed on
+        demand), the examples where the body atom has a true grounding
+        in the model of the example, with the variables shared with the
+        head bound by the example.
+    The coverage of a rule is the intersection of the bitsets of its
+    head and of its body atoms: it ignores the variables shared only
+    among the body atoms, so it is an over-approximation of the real
+    coverage, and a program whose rules cover no positive example can be
+    discarded without learning it.
+    """
+    def __init__(self,
+            prolog_int : PrologInterface,
+            head_candidates : 'list[Atom]',
+            body_candidates : 'list[Atom]',
+            folds : 'list[str]',
+            verbosity : int = 0
+        ) -> None:
+        start_time = time.time()
+        self.prolog_int = prolog_int
+        self.head_candidates = head_candidates
+        self.body_candidates = body_candidates
+        self.folds = folds
+
+        # number of examples of each head predicate (name, arity)
+        self.n_positive : 'dict[tuple[str, int], int]' = {}
+        self.n_negative : 'dict[tuple[str, int], int]' = {}
+        self.head_positive : 'list[list[int]]' = []
+        self.head_negative : 'list[list[int]]' = []
+        for a in head_candidates:
+            predicate = (a.name, a.arity)
+            if predicate not in self.n_positive:
+                self.n_positive[predicate] = prolog_int.get_number_of_examples(a.possible_instantiations[0], folds)
+                self.n_negative[predicate] = prolog_int.get_number_of_examples(a.possible_instantiations[0], folds, True)
+            self.head_positive.append([prolog_int.get_coverage_mask(i, "true", folds) for i in a.possible_instantiations])
+            self.head_negative.append([prolog_int.get_coverage_mask(i, "true", folds, True) for i in a.possible_instantiations])
+        self.total_positive : int = sum(self.n_positive.values())
+        self.total_negative : int = sum(self.n_negative.values())
+
+        # (head atom, head instantiation, body atom, body instantiation)
+        # -> positive and negative bitsets
+        self.pairs : 'dict[tuple[int, int, int, int], tuple[int, int]]' = {}
+        # coverage of the rules, computed on demand
+        self.rules_cache : 'dict[tuple, tuple[int, int]]' = {}
+        self.building_time = time.time() - start_time
+        self.prescreened : int = 0
+
+        # if no positive example is found (for instance, if the examples
+        # are not in models) the bitsets are useless
+        self.enabled : bool = self.total_positive > 0
+        if not self.enabled:
+            print("Coverage index: no positive example found in the models, prescreening disabled")
+
+        if verbosity >= 1:
+            print(f"Coverage index: {self.total_positive} positive and {self.total_negative} negative examples, built in {self.building_time} seconds")
+
+    def _get_pair_coverage(self, head : 'list[int]', atom : 'list[int]') -> 'tuple[int, int]':
+        key = (head[0], head[1], atom[0], atom[1])
+        if key not in self.pairs:
+            h = self.head_candidates[head[0]].possible_instantiations[head[1]]
+            b = self.body_candidates[atom[0]].possible_instantiations[atom[1]]
+            self.pairs[key] = (
+                self.prolog_int.get_coverage_mask(h, b, self.folds),
+                self.prolog_int.get_coverage_mask(h, b, self.folds, True)
+            )
+        return self.pairs[key]
+
+    def get_rule_coverage(self, rule : 'Rule') -> 'tuple[int, int]':
+        """
+        Bitsets of the positive and negative examples (of the predicate
+        of the head) covered by the rule.
+        """
+        key = rule.get_key()
+        if key not in self.rules_cache:
+            positive = self.head_positive[rule.head[0]][rule.head[1]]
+            negative = self.head_negative[rule.head[0]][rule.head[1]]
+            for a in rule.body:
+                p, n = self._get_pair_coverage(rule.head, a)
+                positive &= p
+                negative &= n
+            self.rules_cache[key] = (positive, negative)
+        return self.rules_cache[key]
+
+    def get_coverage(self, individual : 'Individual') -> 'tuple[int, int]':
+        """
+        Number of positive and negative examples covered by at least a
+        rule of the individual.
+        """
+        positive : 'dict[tuple[str, int], int]' = {}
+        negative : 'dict[tuple[str, int], int]' = {}
+        for r in individual.rules:
+            p, n = self.get_rule_coverage(r)
+            head = self.head_candidates[r.head[0]]
+            predicate = (head.name, head.arity)
+            positive[predicate] = positive.get(predicate, 0) | p
+            negative[predicate] = negative.get(predicate, 0) | n
+        return sum(bin(p).count("1") for p in positive.values()), sum(bin(n).count("1") for n in negative.values())
+
+    def get_approximate_fitness(self, individual : 'Individual') -> float:
+        """
+        Approximate fitness, available before learning: fraction of the
+        positive examples covered minus fraction of the negative
+        examples covered.
+        """
+        positive, negative = self.get_coverage(individual)
+        fitness = 0.0
+        if self.total_positive > 0:
+            fitness += positive / self.total_positive
+        if self.total_negative > 0:
+            fitness -= negative / self.total_negative
+        return fitness
+
+    def prescreen(self, individuals : 'list[Individual]') -> 'list[Individual]':
+        """
+        Removes the individuals that cannot cover any positive example,
+        and stores the approximate fitness of the others (logged with
+        the evaluated individuals).
+        """
+        if not self.enabled:
+            return individuals
+        selected : 'list[Individual]' = []
+        for i in individuals:
+            if self.get_coverage(i)[0] > 0:
+                i.approximate_fitness = self.get_approximate_fitness(i)
+                selected.append(i)
+        self.prescreened += len(individuals) - len(selected)
+        return selected
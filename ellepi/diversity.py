@@ -0,0 +1,169 @@
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .genetic import Individual, Rule
+
+
+class DiversityTracker:
+    """
+    Keeps track of the diversity of the population, measured as the
+    Jaccard distance between the sets of rules of the individuals.
+    Each rule is mapped to an integer id and an inverted index (rule id
+    -> individuals containing it) is kept, so adding or removing an
+    individual only costs the number of individuals that share a rule
+    with it: pairs with no rule in common have distance 1 and are never
+    visited.
+    It also maintains the niche counts for fitness sharing, with the
+    sharing function sh(d) = 1 - (d/radius)^alpha if d < radius, 0
+    otherwise (radius <= 1, so disjoint individuals do not share).
+    """
+    def __init__(self,
+            sharing_radius : float = 0.5,
+            sharing_alpha : float = 1
+        ) -> None:
+        self.sharing_radius = min(max(sharing_radius, 1e-9), 1)
+        self.sharing_alpha = sharing_alpha
+        # ids of the rules of the members (and of the individual being
+        # compared), released when no member contains the rule
+        self.rule_ids : 'dict[tuple, int]' = {}
+        self.rule_keys : 'dict[int, tuple]' = {}
+        self.next_rule_id : int = 0
+        # individuals are identified by their (unique) birth_time, so the
+        # iteration order of the sets, and thus the results, are
+        # reproducible
+        self.members : 'dict[int, Individual]' = {}
+        self.rule_sets : 'dict[int, frozenset[int]]' = {}
+        self.postings : 'dict[int, set[int]]' = {}
+        self.niche_counts : 'dict[int, float]' = {}
+        # sum of the Jaccard similarities over all the pairs of members
+        self.similarity_sum : float = 0
+
+    def get_rule_id(self, rule : 'Rule') -> int:
+        """
+        Canonical id of a rule: rules with the same head and the same
+        set of body atoms get the same id.
+        """
+        key = rule.get_key()
+        if key not in self.rule_ids:
+            self.rule_ids[key] = self.next_rule_id
+            self.rule_keys[self.next_rule_id] = key
+            self.next_rule_id += 1
+        return self.rule_ids[key]
+
+    def _release(self, rule_set : 'frozenset[int]') -> None:
+        """
+        Forgets the ids of the rules of rule_set not in any member.
+        """
+        for rule_id in rule_set:
+            if rule_id not in self.postings and rule_id in self.rule_keys:
+                del self.rule_ids[self.rule_keys.pop(rule_id)]
+
+    def get_rule_set(self, individual : 'Individual') -> 'frozenset[int]':
+        return frozenset(self.get_rule_id(r) for r in individual.rules)
+
+    def _get_similarities(self, rule_set : 'frozenset[int]', exclude : int = -1) -> 'dict[int, float]':
+        """
+        Jaccard similarity between rule_set and the members sharing at
+        least one rule with it.
+        """
+        intersections : 'dict[int, int]' = {}
+        for rule_id in rule_set:
+            for member in self.postings.get(rule_id, ()):
+                if member != exclude:
+                    intersections[member] = intersections.get(member, 0) + 1
+        similarities : 'dict[int, float]' = {}
+        for member, n_common in intersections.items():
+            n_union = len(rule_set) + len(self.rule_sets[member]) - n_common
+            similarities[member] = n_common / n_union
+        return similarities
+
+    def _sharing(self, similarity : float) -> float:
+        distance = 1 - similarity
+        if distance >= self.sharing_radius:
+            return 0
+        return 1 - (distance / self.sharing_radius) ** self.sharing_alpha
+
+    def add(self, individual : 'Individual') -> None:
+        """
+        Adds an individual to the tracked population.
+        """
+        key = individual.birth_time
+        if key in self.members:
+            return
+        rule_set = self.get_rule_set(individual)
+        similarities = self._get_similarities(rule_set)
+        niche_count : float = 1 # sh(0) for the individual itself
+        for member, similarity in similarities.items():
+            self.similarity_sum += similarity
+            sh = self._sharing(similarity)
+            self.niche_counts[member] += sh
+            niche_count += sh
+        self.niche_counts[key] = niche_count
+
+        self.members[key] = individual
+        self.rule_sets[key] = rule_set
+        for rule_id in rule_set:
+            self.postings.setdefault(rule_id, set()).add(key)
+
+    def remove(self, individual : 'Individual') -> None:
+        """
+        Removes an individual from the tracked population.
+        """
+        key = individual.birth_time
+        if key not in self.members:
+            return
+        rule_set = self.rule_sets[key]
+        for rule_id in rule_set:
+            self.postings[rule_id].discard(key)
+            if len(self.postings[rule_id]) == 0:
+                del self.postings[rule_id]
+        self._release(rule_set)
+        for member, similarity in self._get_similarities(rule_set, key).items():
+            self.similarity_sum -= similarity
+            self.niche_counts[member] -= self._sharing(similarity)
+
+        del self.members[key]
+        del self.rule_sets[key]
+        del self.niche_counts[key]
+
+    def get_shared_fitness(self, individual : 'Individual') -> float:
+        """
+        Score of the individual scaled by its niche count. Since the
+        score is a (negative) LL, it is multiplied by the niche count, so
+        individuals in crowded niches get a worse shared fitness.
+        """
+        niche_count = self.niche_counts.get(individual.birth_time, 1)
+        if individual.score <= 0:
+            return individual.score * niche_count
+        return individual.score / niche_count
+
+    def get_nearest(self, individual : 'Individual') -> 'tuple[Individual | None, float]':
+        """
+        Most similar member (and its distance) to the individual, that
+        can also be not tracked. Returns None if no member shares a rule
+        with the individual.
+        """
+        rule_set = self.get_rule_set(individual)
+        similarities = self._get_similarities(rule_set, individual.birth_time)
+        if individual.birth_time not in self.members:
+            self._release(rule_set)
+        if len(similarities) == 0:
+            return None, 1
+        # ties broken in favour of the worst, then of the oldest, member
+        nearest = max(similarities, key=lambda m : (similarities[m], -self.members[m].score, -m))
+        return self.members[nearest], 1 - similarities[nearest]
+
+    def get_mean_distance(self) -> float:
+        """
+        Mean Jaccard distance over all the pairs of members.
+        """
+        n = len(self.members)
+        if n < 2:
+            return 0
+        return max(0, 1 - self.similarity_sum / (n * (n - 1) / 2))
+
+    def get_number_of_distinct_rules(self) -> int:
+        return len(self.postings)
+
+    def __str__(self) -> str:
+        return f"Diversity: mean distance {self.get_mean_distance():.4f}, distinct rules: {self.get_number_of_distinct_rules()}"
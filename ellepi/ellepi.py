@@ -1,10 +1,6 @@
 from argparse import Namespace
-import random
 
 from .argparser import parse_args
-from .genetic import GeneticOptions, GeneticAlgorithm
-from .prolog_interface import PrologInterface
-from .variable_placer import Atom
 
 def main():
     """
@@ -13,26 +9,39 @@ def main():
     args: Namespace = parse_args()
     print(args)
     
-    random.seed(args.seed)
+    # imported after parsing the arguments, so --help and argument
+    # errors do not load numpy and the Prolog engine
+    from .api import build_atoms
+    from .genetic import GeneticOptions, GeneticAlgorithm
+    from .prolog_interface import PrologInterface
+    from .replay import RecordingBackend, ReplayBackend
     
-    prolog_int = PrologInterface(args.filename, args.backend, args.verbosity)
+    if args.replay_file != "":
+        # no Prolog: the results come from a recording
+        prolog_int = ReplayBackend.from_file(
+            args.replay_file,
+            latency=args.replay_latency,
+            latency_scale=args.replay_latency_scale,
+            backend=args.backend
+        )
+    else:
+        prolog_int = PrologInterface(
+            args.filename,
+            args.backend,
+            args.verbosity,
+            stack_limit=args.stack_limit,
+            table_space=args.table_space,
+            seed=args.seed
+        )
+        if args.record_file != "":
+            if args.workers > 1:
+                # the workers would bypass the recording
+                print("Recording the evaluations, using a single process")
+                args.workers = 1
+            prolog_int = RecordingBackend(prolog_int, args.record_file)
     
     # get modes to generate placements
-    modeh, modeb = prolog_int.get_modes()
-    
-    atoms_head : 'list[Atom]' = []
-    atoms_body : 'list[Atom]' = []
-    
-    for atom in modeh:
-        # to remove everything after -/+
-        cleaned_arguments: 'list[str]' = [a[0] for a in atom[1:]]
-        at = Atom(atom[0], cleaned_arguments, args.nvars)
-        atoms_head.append(at)
-
-    for atom in modeb:
-        cleaned_arguments = [a[0] for a in atom[1:]]
-        at = Atom(atom[0], cleaned_arguments, args.nvars)
-        atoms_body.append(at)
+    atoms_head, atoms_body = build_atoms(prolog_int, args.nvars)
         
     print(atoms_head)
     print(atoms_body)
@@ -62,6 +71,11 @@ def main():
     print(f"AUCROC: {aucroc}")
     print(f"AUCPR: {aucpr}")
     
+    if isinstance(prolog_int, RecordingBackend):
+        prolog_int.save()
+    elif isinstance(prolog_int, ReplayBackend):
+        print(f"Replay: {prolog_int.get_statistics()}")
+    
     
     # get the modes from the file to generate atoms
     
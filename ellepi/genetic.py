@@ -1,5 +1,8 @@
+import collections
 import copy
-import numpy as np # for argmax
+import itertools
+import math
+import numpy as np # for argmax and the batch operators
 import random
 import sys
 import time
@@ -7,8 +10,18 @@ import time
 
 from argparse import Namespace
 
-from .variable_placer import Atom
+from .argparser import get_arguments
+from .variable_placer import Atom, RuleNormaliser
 from .prolog_interface import PrologInterface
+from .surrogate import Surrogate
+from .batch_operators import BatchOperators, PAD
+from .diversity import DiversityTracker
+from .coverage import CoverageIndex
+from .run_logger import RunLogger
+from .resources import MemoryGovernor
+from .rng import RandomStreams
+from .parallel import ParallelEvaluator
+from .operator_rates import AdaptiveOperatorRates, CROSSOVER_TYPES
 
 class GeneticOptions:
     """
@@ -16,6 +29,7 @@ class GeneticOptions:
     """
     def __init__(self, args : Namespace) -> None:
         self.train_set : 'list[str]' = args.train
+        self.test_set : 'list[str]' = args.test
         self.population_size : int = args.popsize
         self.number_of_evolutionary_cycles : int = args.evolutionary_cycles
         self.initial_number_of_rules_per_individual : int = args.rpi
@@ -39,6 +53,50 @@ class GeneticOptions:
         self.max_initial_rule_length : int = 3
         self.sampling_rules_method : str = "weighted" # or random
         self.iterations_print_step : int = 10
+        # surrogate model to skip the evaluation of poor offspring
+        self.use_surrogate : bool = args.surrogate
+        self.surrogate_keep_fraction : float = args.skf
+        self.surrogate_min_samples : int = args.smin
+        # offspring generation
+        self.offspring_pairs : int = args.obs # pairs of parents per iteration
+        self.use_batch_operators : bool = args.batch_operators
+        # replacement and diversity
+        self.replacement : str = args.replacement
+        self.sharing_radius : float = args.sr
+        self.sharing_alpha : float = args.sa
+        self.seed : int = int(args.seed)
+        # start parameter learning from the probabilities of the parents
+        self.warm_start : bool = args.warm_start
+        # discard the offspring that cannot cover positive examples
+        self.use_coverage_index : bool = args.coverage_index
+        # structured log of the run (JSON lines), empty for no log
+        self.log_file : str = args.log_file
+        self.log_sample_rate : float = args.log_sample_rate
+        self.log_rate_limit : int = args.log_rate_limit
+        # memory governor
+        self.max_rss : int = args.max_rss # MB, 0: no limit
+        self.gc_step : int = args.gc_step
+        self.memory_check_step : int = args.memory_check_step
+        self.population_shrink_factor : float = 0.8 # when above max_rss
+        # worker processes for the evaluation
+        self.workers : int = args.workers
+        # canonical rules and cache of the scores
+        self.normalise_rules : bool = args.normalise_rules
+        self.fitness_cache_size : int = 100_000
+        # adaptive operator rates (probability matching)
+        self.adaptive_operators : bool = args.adaptive_operators
+        self.adaptation_rate : float = args.aoa
+        self.min_operator_share : float = args.aomin
+        self.max_rate_factor : float = args.aof
+
+    @classmethod
+    def from_kwargs(cls, **kwargs) -> 'GeneticOptions':
+        """
+        Options from keyword arguments, named as the attributes of the
+        parsed command line arguments (for example popsize=20, par=0.1);
+        the missing ones get the default value of the command line.
+        """
+        return cls(get_arguments(**kwargs))
 
 
 class Rule:
@@ -52,7 +110,10 @@ class Rule:
     def __init__(self,
             head_candidates : 'list[Atom]',
             body_candidates : 'list[Atom]',
-            n_body_atoms : int
+            n_body_atoms : int,
+            head : 'list[int] | None' = None,
+            body : 'list[list[int]] | None' = None,
+            rng : 'random.Random' = random
         ) -> None:
         self.head_candidates = head_candidates
         self.body_candidates = body_candidates
@@ -60,19 +121,26 @@ class Rule:
         self.body : 'list[list[int]]' = []
         self.weight : float = 0
         
+        if head is not None and body is not None:
+            # rule already given, for instance decoded from the array
+            # encoding of the batch operators
+            self.head = head
+            self.body = body
+            return
+        
         allow_atoms_twice : bool = False
         
         # generate a random rule
-        selected_atom = random.randint(0, len(head_candidates) - 1)
-        selected_instantiation = random.randint(0, len(head_candidates[selected_atom].possible_instantiations) - 1)
+        selected_atom = rng.randint(0, len(head_candidates) - 1)
+        selected_instantiation = rng.randint(0, len(head_candidates[selected_atom].possible_instantiations) - 1)
         self.head = [selected_atom, selected_instantiation]
 
         if allow_atoms_twice:
-            selected_atoms = [random.randint(0, len(body_candidates) - 1) for i in range(n_body_atoms)]
+            selected_atoms = [rng.randint(0, len(body_candidates) - 1) for i in range(n_body_atoms)]
         else:
-            selected_atoms = random.sample(list(range(0,len(body_candidates) - 1)), n_body_atoms)
+            selected_atoms = rng.sample(list(range(0,len(body_candidates) - 1)), n_body_atoms)
         for sa in selected_atoms:
-            selected_instantiation = random.randint(0, len(body_candidates[sa].possible_instantiations) - 1)
+            selected_instantiation = rng.randint(0, len(body_candidates[sa].possible_instantiations) - 1)
             self.body.append([sa,selected_instantiation])
         # for _ in range(n_body_atoms):
         #     selected_atom = random.randint(0, len(body_candidates) - 1)
@@ -106,6 +174,19 @@ class Rule:
         r = r[0] + ":0.5 :- " + r[1]
         return f"in([({r})])."
     
+    def get_key(self) -> 'tuple':
+        """
+        Hashable representation of the rule (head and sorted body).
+        """
+        return (tuple(self.head), tuple(sorted(tuple(a) for a in self.body)))
+
+    def normalise(self, normaliser : RuleNormaliser) -> None:
+        """
+        Replaces the rule with the canonical representative of its
+        alpha-equivalence class (see RuleNormaliser).
+        """
+        self.head, self.body = normaliser.normalise(self.head, self.body)
+
     def get_rule_as_str_with_weight(self) -> str:
         return f"{self._get_head_atom()} :- {self._get_body_atoms()} : {self.weight}"
     def __str__(self) -> str:
@@ -129,13 +210,27 @@ class Individual:
     Individual for the genetic algorithm.
     An individual is represented by a set of rules.
     """
+    births = itertools.count()
+
     def __init__(self,
             rules : 'list[Rule]'
         ) -> None:
         self.rules = rules
         self.score : float = 0
         self.complexity : int = 0
-        self.birth_time : float = time.time()
+        # creation order, used as age: unlike the wall clock it is
+        # reproducible and unique
+        self.birth_time : int = next(Individual.births)
+        # probabilities of the rules used as starting point of parameter
+        # learning (warm start), 0.5 if empty, and the learned ones
+        self.initial_probabilities : 'list[float | None]' = []
+        self.learned_probabilities : 'list[float]' = []
+        # operators that generated the individual and best score of its
+        # parents, for the adaptive operator rates
+        self.operators : 'list[str]' = []
+        self.parent_score : 'float | None' = None
+        # approximate fitness given by the coverage index, if used
+        self.approximate_fitness : 'float | None' = None
         self._compute_complexity()
         # self.compute_score()
     
@@ -152,14 +247,42 @@ class Individual:
         Returns an individual as an input program for the backend.
         """
         current_in = "in(["
-        for rule in self.rules:
+        for rule, prob in zip(self.rules, self.get_initial_probabilities_as_str()):
             r = str(rule).split(":-") # to add the probability
-            r = r[0] + ":0.5 :- " + r[1]
+            r = r[0] + f":{prob} :- " + r[1]
             current_in += f"({r}),"
         current_in = current_in[:-1]
         current_in += "])."
         return current_in
 
+    def get_key(self) -> 'tuple':
+        """
+        Hashable representation of the individual (multiset of rules).
+        """
+        return tuple(sorted(r.get_key() for r in self.rules))
+
+    def get_initial_probabilities_as_str(self) -> 'list[str]':
+        """
+        Initial probabilities of the rules, as written in the input
+        program.
+        """
+        probs : 'list[str]' = []
+        for idx in range(len(self.rules)):
+            prob = "0.5"
+            if idx < len(self.initial_probabilities) and self.initial_probabilities[idx] is not None:
+                # avoid 0 and 1, EM cannot move from there
+                prob = f"{min(max(self.initial_probabilities[idx], 0.01), 0.99):.4f}"
+            probs.append(prob)
+        return probs
+
+    def get_learned_probabilities_by_rule(self) -> 'dict[tuple, float]':
+        """
+        Learned probability of each rule, indexed by Rule.get_key().
+        """
+        if len(self.learned_probabilities) != len(self.rules):
+            return {}
+        return {r.get_key() : p for r, p in zip(self.rules, self.learned_probabilities)}
+
     def __str__(self) -> str:
         s = "\n".join([str(r) for r in self.rules])
         return f"Individual with score: {self.score}, complexity: {self.complexity}\n" + s + "\n---\n"
@@ -186,6 +309,122 @@ class GeneticAlgorithm:
         self.prolog_int = prolog_int
         self.options = options
         self.population : 'list[Individual]' = []
+        self.iteration : int = 0
+        # independent random streams for each component (see rng.py)
+        self.streams = RandomStreams(self.options.seed)
+        self.evaluator : 'PrologInterface | ParallelEvaluator' = prolog_int
+        if self.options.workers > 1:
+            if prolog_int.bg_text == "":
+                print("The background knowledge is not available to the workers, using a single process")
+            else:
+                self.evaluator = ParallelEvaluator(prolog_int, self.options.workers)
+        self.statistics : 'dict[str, float]' = {"evaluations" : 0, "cache_hits" : 0}
+        
+        self.normaliser : 'RuleNormaliser | None' = None
+        # least recently used entries first
+        self.fitness_cache : 'collections.OrderedDict[tuple, tuple[list, list[tuple]]] | None' = None
+        if self.options.normalise_rules:
+            self.normaliser = RuleNormaliser(head_candidates, body_candidates)
+            self.fitness_cache = collections.OrderedDict()
+        if self.options.warm_start:
+            self.statistics.update({
+                "warm_rules" : 0, # rules started from a learned probability
+                "cold_rules" : 0, # rules started from 0.5
+                "warm_programs" : 0, # programs with at least a warm rule
+                "warm_time" : 0, # learning time of the warm programs
+                "cold_programs" : 0,
+                "cold_time" : 0
+            })
+        
+        # probabilities of the operators, changed during the run by the
+        # adaptive operator rates
+        self.rates : 'dict[str, float]' = {
+            "add_rule" : self.options.prob_add_rule,
+            "drop_rule" : self.options.prob_drop_rule,
+            "modify" : self.options.prob_modify,
+            "change_atom" : self.options.prob_change_atom,
+            "change_instantiation" : self.options.prob_change_instantiation
+        }
+        self.operator_rates : 'AdaptiveOperatorRates | None' = None
+        if self.options.adaptive_operators:
+            for ct in CROSSOVER_TYPES:
+                if self.options.crossover_type in CROSSOVER_TYPES:
+                    self.rates[ct] = float(ct == self.options.crossover_type)
+                else:
+                    self.rates[ct] = 1 / len(CROSSOVER_TYPES)
+            self.operator_rates = AdaptiveOperatorRates(
+                self.rates,
+                self.options.adaptation_rate,
+                self.options.min_operator_share,
+                self.options.max_rate_factor
+            )
+            self.rates = self.operator_rates.rates
+        
+        self.batch_operators : 'BatchOperators | None' = None
+        if self.options.use_batch_operators:
+            self.batch_operators = BatchOperators(
+                head_candidates,
+                body_candidates,
+                self.options.prob_add_rule,
+                self.options.prob_drop_rule,
+                self.options.prob_modify,
+                self.options.prob_change_atom,
+                self.options.prob_change_instantiation,
+                self.options.max_initial_rule_length,
+                self.streams.get_generator("batch")
+            )
+        
+        self.logger : 'RunLogger | None' = None
+        if self.options.log_file != "":
+            self.logger = RunLogger(
+                self.options.log_file,
+                self.options.log_sample_rate,
+                self.options.log_rate_limit
+            )
+            self.logger.log_header(head_candidates, body_candidates, options=vars(self.options))
+        
+        self.governor : 'MemoryGovernor | None' = None
+        if self.options.max_rss > 0 or self.options.gc_step > 0:
+            self.governor = MemoryGovernor(
+                self.evaluator,
+                self.options.max_rss,
+                self.options.gc_step,
+                self.options.memory_check_step,
+                self.options.verbosity
+            )
+        
+        self.diversity = DiversityTracker(self.options.sharing_radius, self.options.sharing_alpha)
+        
+        self.coverage : 'CoverageIndex | None' = None
+        if self.options.use_coverage_index:
+            self.coverage = CoverageIndex(
+                prolog_int,
+                head_candidates,
+                body_candidates,
+                self.options.train_set,
+                self.options.verbosity
+            )
+        
+        self.surrogate : 'Surrogate | None' = None
+        if self.options.use_surrogate:
+            self.surrogate = Surrogate(
+                head_candidates,
+                body_candidates,
+                self.options.surrogate_keep_fraction,
+                self.options.surrogate_min_samples
+            )
+        
+        if self.governor is not None:
+            if self.coverage is not None:
+                self.governor.register(self.coverage.rules_cache.clear)
+            if self.logger is not None:
+                self.governor.register(self.logger.flush)
+            if self.fitness_cache is not None:
+                self.governor.register(self.fitness_cache.clear)
+            if self.normaliser is not None:
+                self.governor.register(self.normaliser.clear_observed)
+            if isinstance(self.evaluator, ParallelEvaluator):
+                self.governor.register(self.evaluator.recycle)
         
         self._init_population()
     
@@ -196,27 +435,43 @@ class GeneticAlgorithm:
         """
         population : 'list[Individual]' = []
         available_rules : 'list[Rule]' = []
+        rng = self.streams.get_random("population")
+        rules_probabilities : 'dict[tuple, float]' = {}
         max_attempts : int = 10_000
         
         # generate the available rules
         for _ in range(self.options.rules_to_generate):
-            rl = random.randint(1, self.options.max_initial_rule_length) # random body length
-            r = Rule(self.head_candidates, self.body_candidates, rl)
+            rl = rng.randint(1, self.options.max_initial_rule_length) # random body length
+            r = Rule(self.head_candidates, self.body_candidates, rl, rng=rng)
+            if self.normaliser is not None:
+                r.normalise(self.normaliser)
+                if r in available_rules:
+                    # alpha-equivalent to an already generated rule
+                    continue
             available_rules.append(r)
         
         available_rules.sort()
         if self.options.sampling_rules_method == "weighted":
             # much faster than doing one by one
             rr = [r.get_rule_as_input_program() for r in available_rules]
-            ll_rules = self.prolog_int.compute_ll_rules(rr, self.options.train_set)
+            ll_rules = self.evaluator.compute_ll_rules(rr, self.options.train_set, self.options.warm_start)
             
-            for (ll,sum_p), idx in zip(ll_rules,range(len(available_rules))):
+            for res, idx in zip(ll_rules,range(len(available_rules))):
+                ll, sum_p = res[0], res[1]
                 available_rules[idx].weight = ll - self.options.regularization_score*sum_p
+                if self.options.warm_start and len(res[2]) > 0:
+                    # probability learned for the rule alone (none if
+                    # the learning failed)
+                    rules_probabilities[available_rules[idx].get_key()] = res[2][0]
         
         if self.options.verbosity >= 2:
-            print("Initial available rules")
-            for r in available_rules:
-                print(r.get_rule_as_str_with_weight())
+            if self.logger is not None:
+                for r in available_rules:
+                    self.logger.log("available_rule", score=r.weight, rules=[[r.head, r.body]])
+            else:
+                print("Initial available rules")
+                for r in available_rules:
+                    print(r.get_rule_as_str_with_weight())
                 
             # print(*available_rules, sep="\n")
         
@@ -224,17 +479,19 @@ class GeneticAlgorithm:
         while len(population) < self.options.population_size:
             # perform weighted sampling for individuals
             if self.options.sampling_rules_method == "weighted":
-                weights = [-w.weight for w in available_rules] # - since LL is negative
-                current_rules = random.choices(
+                # - since LL is negative, 0 for the rules that could not be evaluated
+                weights = [-w.weight if math.isfinite(w.weight) else 0 for w in available_rules]
+                current_rules = rng.choices(
                     population=available_rules,
-                    weights=weights,
+                    # uniform if no rule could be evaluated
+                    weights=weights if sum(weights) > 0 else None,
                     k=self.options.initial_number_of_rules_per_individual
                 )
                 current_rules.sort()
                 new_individual = Individual(current_rules)
             else:
                 new_individual = Individual(
-                    random.sample(
+                    rng.sample(
                         available_rules,
                         self.options.initial_number_of_rules_per_individual
                     )
@@ -250,30 +507,171 @@ class GeneticAlgorithm:
                 print(f"max: {max_attempts}, length population: {len(population)}")
         
         # computation of the LL of the individuals
-
-        l = [ir.get_individual_as_input_program() for ir in population]
-        ll_rules_and_sum_prob = self.prolog_int.compute_ll_rules(l, self.options.train_set)
-        # subtract regularization since the LL is neg
-        
-        for (ll,sum_p), idx in zip(ll_rules_and_sum_prob,range(len(population))):
-            # population[idx].score = ll - self.options.regularization_score*population[idx].complexity
-            population[idx].score = ll - self.options.regularization_score*sum_p
+        if self.options.warm_start:
+            for ind in population:
+                ind.initial_probabilities = [rules_probabilities.get(r.get_key()) for r in ind.rules]
+        self._evaluate(population)
         
         # sort the population in terms of score
         population.sort(reverse=True)
         self.population = population
+        for ind in self.population:
+            self.diversity.add(ind)
         
         if self.options.verbosity >= 2:
-            for i in self.population:
-                print(i)
-                print(i.get_individual_as_input_program())
-                
-            print(*self.population)
+            if self.logger is not None:
+                self.logger.log_individuals("initial_population", self.population)
+            else:
+                for i in self.population:
+                    print(i)
+                    print(i.get_individual_as_input_program())
+                    
+                print(*self.population)
     
-    def _select_individuals(self) -> 'tuple[Individual,Individual]':
+    def _shrink_population(self) -> None:
+        """
+        Drops the worst individuals, to reduce the memory.
+        """
+        new_size = max(2, int(len(self.population) * self.options.population_shrink_factor))
+        if self.options.verbosity >= 1:
+            print(f"Memory: reducing the population from {len(self.population)} to {new_size}")
+        for dropped in self.population[new_size:]:
+            self.diversity.remove(dropped)
+        self.population = self.population[:new_size]
+
+    def _show_individuals(self, level : int, title : str, event : str, individuals : 'list[Individual]') -> None:
+        """
+        Verbose output about some individuals, if verbosity >= level:
+        logged as events if there is a run logger, printed otherwise.
+        """
+        if self.options.verbosity < level:
+            return
+        if self.logger is not None:
+            self.logger.log_individuals(event, individuals, iteration=self.iteration)
+        else:
+            print(title)
+            for i in individuals:
+                print(i)
+
+    def _evaluate(self, individuals : 'list[Individual]') -> 'list[Individual]':
+        """
+        Computes the score of the individuals with the backend and
+        trains the surrogate model (if any) with them.
+        With the fitness cache, the programs already evaluated (as
+        canonical rule sets) are not sent to the backend again; when
+        full, the least recently used programs are evicted.
+        Returns the individuals sent to the backend.
+        """
+        if len(individuals) == 0:
+            return []
+        to_evaluate : 'list[Individual]' = individuals
+        # cached results needed in this call, read before the eviction
+        found : 'dict[tuple, tuple[list, list[tuple]]]' = {}
+        if self.fitness_cache is not None:
+            keys = [self._get_cache_key(ir) for ir in individuals]
+            to_evaluate = []
+            pending : 'set[tuple]' = set()
+            for ir, k in zip(individuals, keys):
+                if k in self.fitness_cache:
+                    self.fitness_cache.move_to_end(k)
+                    found[k] = self.fitness_cache[k]
+                elif k not in pending:
+                    to_evaluate.append(ir)
+                    pending.add(k)
+            self.statistics["cache_hits"] += len(individuals) - len(to_evaluate)
+
+        l = [ir.get_individual_as_input_program() for ir in to_evaluate]
+        ll_ind = self.evaluator.compute_ll_rules(l, self.options.train_set, self.options.warm_start) if len(l) > 0 else []
+        self.statistics["evaluations"] += len(to_evaluate)
+
+        if self.options.warm_start:
+            for res, idx in zip(ll_ind, range(len(to_evaluate))):
+                self._record_warm_start(to_evaluate[idx], self.evaluator.query_times[idx])
+
+        if self.fitness_cache is not None:
+            for ir, res in zip(to_evaluate, ll_ind):
+                k = self._get_cache_key(ir)
+                found[k] = (res, [r.get_key() for r in ir.rules])
+                self.fitness_cache[k] = found[k]
+            while len(self.fitness_cache) > self.options.fitness_cache_size:
+                self.fitness_cache.popitem(last=False)
+            ll_ind = []
+            for ir, k in zip(individuals, keys):
+                res, rule_keys = found[k]
+                if self.options.warm_start:
+                    # learned probabilities in the order of the rules of ir
+                    learned = dict(zip(rule_keys, res[2]))
+                    res = [res[0], res[1], [learned.get(r.get_key(), 0.5) for r in ir.rules]]
+                ll_ind.append(res)
+
+        # subtract regularization since the LL is neg
+        for res, idx in zip(ll_ind, range(len(individuals))):
+            ll, sum_p = res[0], res[1]
+            # individuals[idx].score = ll - self.options.regularization_score*individuals[idx].complexity
+            individuals[idx].score = ll - self.options.regularization_score*sum_p
+            if self.surrogate is not None and math.isfinite(individuals[idx].score):
+                self.surrogate.update(individuals[idx], individuals[idx].score)
+            if self.options.warm_start:
+                individuals[idx].learned_probabilities = res[2]
+
+        if self.logger is not None:
+            self.logger.log_individuals("evaluated", individuals, iteration=self.iteration)
+
+        return to_evaluate
+
+    def _get_cache_key(self, individual : 'Individual') -> 'tuple':
+        """
+        Key of an individual in the fitness cache: its canonical rules
+        and, with warm start, also their initial probabilities, since
+        the learned parameters (and so the LL) depend on them.
+        """
+        if not self.options.warm_start:
+            return individual.get_key()
+        return tuple(sorted(zip([r.get_key() for r in individual.rules], individual.get_initial_probabilities_as_str())))
+
+    def _record_warm_start(self, individual : 'Individual', learning_time : float) -> None:
         """
-        Selections of the individuals.
+        Updates the statistics about warm started parameter learning:
+        the time spent by programs with at least one warm started rule
+        compared to the one of the programs starting from scratch
+        estimates the saving.
         """
+        n_warm = len([p for p in individual.initial_probabilities if p is not None])
+        self.statistics["warm_rules"] += n_warm
+        self.statistics["cold_rules"] += len(individual.rules) - n_warm
+        kind = "warm" if n_warm > 0 else "cold"
+        self.statistics[f"{kind}_programs"] += 1
+        self.statistics[f"{kind}_time"] += learning_time
+
+    def _print_warm_start_statistics(self) -> None:
+        st = self.statistics
+        print(f"Warm start: {st['warm_rules']} warm rules, {st['cold_rules']} cold rules")
+        if st["warm_programs"] > 0 and st["cold_programs"] > 0:
+            warm_mean = st["warm_time"] / st["warm_programs"]
+            cold_mean = st["cold_time"] / st["cold_programs"]
+            print(f"Mean learning time: warm {warm_mean:.4f} s, cold {cold_mean:.4f} s, estimated saving: {(cold_mean - warm_mean)*st['warm_programs']:.2f} s")
+
+    def _inherit_probabilities(self, offspring : 'list[Individual]', parents : 'list[tuple[Individual,Individual]]') -> None:
+        """
+        Sets the initial probabilities of the rules of the offspring
+        (the two children of the i-th pair of parents are in positions
+        2i and 2i+1) to the ones learned for the same rules in the
+        parents. If a rule is not in the parents (new or modified), it
+        starts from 0.5.
+        """
+        for idx, ind in enumerate(offspring):
+            i0, i1 = parents[idx // 2]
+            learned = i1.get_learned_probabilities_by_rule()
+            learned.update(i0.get_learned_probabilities_by_rule())
+            ind.initial_probabilities = [learned.get(r.get_key()) for r in ind.rules]
+
+    def _select_individuals(self, rng : random.Random, crossover_type : 'str | None' = None) -> 'tuple[Individual,Individual]':
+        """
+        Selections of the individuals, with the crossover type of the
+        options if crossover_type is None.
+        """
+        if crossover_type is None:
+            crossover_type = self.options.crossover_type
         # def get_from_tournament():
         #     prob_selecting_fittest = 0.9
         #     how_many = min(2, int(len(self.population)*self.options.tournament_percentage/100))
@@ -290,23 +688,23 @@ class GeneticAlgorithm:
         # random selection
         r0 = 0
         r1 = 0
-        if self.options.crossover_type == "random":
-            r0 = random.randint(0, len(self.population) - 1)
-            r1 = random.randint(0, len(self.population) - 1)
-        elif self.options.crossover_type == "fittest":
+        if crossover_type == "random":
+            r0 = rng.randint(0, len(self.population) - 1)
+            r1 = rng.randint(0, len(self.population) - 1)
+        elif crossover_type == "fittest":
             scores = [x.score for x in self.population]
             r0 = np.argmax(scores)
             scores.pop(r0)
             r1 = np.argmax(scores)
-        elif self.options.crossover_type == "tournament":
+        elif crossover_type == "tournament":
             # i0 = get_from_tournament()
             print("still to implement tournament crossover type")
             sys.exit()
-        elif self.options.crossover_type == "rank":
+        elif crossover_type == "rank":
             tot_rank = len(self.population) * (len(self.population) + 1) / 2
             l : 'list[int]' = []
             while len(l) != 2:
-                r = random.random()
+                r = rng.random()
                 i = 1
                 idx_selected = -1
                 for i in range(1, len(self.population) + 1):
@@ -323,15 +721,21 @@ class GeneticAlgorithm:
             r0 = l[0]
             r1 = l[1]
         
-        return Individual(self.population[r0].rules), Individual(self.population[r1].rules)
+        i0 = Individual(self.population[r0].rules)
+        i0.learned_probabilities = self.population[r0].learned_probabilities
+        i0.score = self.population[r0].score
+        i1 = Individual(self.population[r1].rules)
+        i1.learned_probabilities = self.population[r1].learned_probabilities
+        i1.score = self.population[r1].score
+        return i0, i1
 
-    def _crossover(self, i0 : Individual, i1 : Individual) -> 'tuple[Individual,Individual]':
+    def _crossover(self, i0 : Individual, i1 : Individual, rng : random.Random) -> 'tuple[Individual,Individual]':
         """
         Crossover of the individuals i0 and i1
         """
 
-        idx0 = random.randint(0, len(i0.rules))
-        idx1 = random.randint(0, len(i1.rules))
+        idx0 = rng.randint(0, len(i0.rules))
+        idx1 = rng.randint(0, len(i1.rules))
         
         idx0 = min(len(i1.rules), idx0)
         idx1 = min(len(i0.rules), idx1)
@@ -341,7 +745,7 @@ class GeneticAlgorithm:
         
         return (new_individual_01, new_individual_10)
 
-    def _mutate(self, i : Individual) -> Individual:
+    def _mutate(self, i : Individual, rng : random.Random) -> Individual:
         """
         Applies mutation. Several kinds:
         - add rule
@@ -353,12 +757,21 @@ class GeneticAlgorithm:
             - change instantiation of such atom
         """
         
-        if random.random() < self.options.prob_add_rule:
-            rl = random.randint(1, self.options.max_initial_rule_length) # random body length
-            new_rule = Rule(self.head_candidates, self.body_candidates, rl)
+        applied : 'list[str]' = []
+        if rng.random() < self.rates["add_rule"]:
+            rl = rng.randint(1, self.options.max_initial_rule_length) # random body length
+            new_rule = Rule(self.head_candidates, self.body_candidates, rl, rng=rng)
+            if self.normaliser is not None:
+                new_rule.normalise(self.normaliser)
             i.rules.append(new_rule)
+            applied.append("add_rule")
         
-        should_drop = [random.random() < self.options.prob_drop_rule for _ in range(len(i.rules))]
+        should_drop = [rng.random() < self.rates["drop_rule"] for _ in range(len(i.rules))]
+        if len(should_drop) > 0 and all(should_drop):
+            # never drop all the rules: an empty program is not valid
+            should_drop[0] = False
+        if any(should_drop):
+            applied.append("drop_rule")
         # to_drop = [i for i, j in enumerate(should_drop) if j == True]
         new_rules : 'list[Rule]' = []
         for rule, drop in zip(i.rules, should_drop):
@@ -366,28 +779,196 @@ class GeneticAlgorithm:
                 new_rules.append(rule)
 
         for idx_rule, r in enumerate(new_rules):
-            if random.random() < self.options.prob_modify:
+            if rng.random() < self.rates["modify"]:
+                applied.append("modify")
                 new_body : 'list[list[int]]' = []
                 for idx, a in enumerate(r.body):
-                    mutation_kind = random.choices([0,1,2],[
-                        self.options.prob_change_atom,
-                        self.options.prob_change_instantiation,
-                        1 - (self.options.prob_change_atom + self.options.prob_change_instantiation)])[0]
+                    mutation_kind = rng.choices([1,2,0],[
+                        self.rates["change_atom"],
+                        self.rates["change_instantiation"],
+                        1 - (self.rates["change_atom"] + self.rates["change_instantiation"])])[0]
                     if mutation_kind == 1: # change atom
-                        selected_atom = random.randint(0, len(r.body_candidates) - 1)
-                        selected_instantiation = random.randint(0, len(r.body_candidates[selected_atom].possible_instantiations) - 1)
+                        selected_atom = rng.randint(0, len(r.body_candidates) - 1)
+                        selected_instantiation = rng.randint(0, len(r.body_candidates[selected_atom].possible_instantiations) - 1)
                         new_body.append([selected_atom,selected_instantiation])
+                        applied.append("change_atom")
                     elif mutation_kind == 2: # change instantiation
                         selected_atom = r.body[idx][0]
-                        selected_instantiation = random.randint(0, len(r.body_candidates[selected_atom].possible_instantiations) - 1)
+                        selected_instantiation = rng.randint(0, len(r.body_candidates[selected_atom].possible_instantiations) - 1)
                         new_body.append([selected_atom,selected_instantiation])
+                        applied.append("change_instantiation")
                     else: # do nothing
                         new_body.append(a)
                 new_rules[idx_rule].body = new_body
+                if self.normaliser is not None:
+                    new_rules[idx_rule].normalise(self.normaliser)
         
-        return Individual(new_rules)
+        mutated = Individual(new_rules)
+        mutated.operators = applied
+        return mutated
                 
 
+    def _encode(self, individuals : 'list[Individual]', max_rules : int, max_body : int) -> 'tuple[np.ndarray, np.ndarray]':
+        """
+        Array encoding of a block of individuals (see batch_operators).
+        """
+        rules = np.full((len(individuals), max_rules, 2 + 2*max_body), PAD, dtype=np.int64)
+        n_rules = np.zeros(len(individuals), dtype=np.int64)
+        for idx_ind, ind in enumerate(individuals):
+            n_rules[idx_ind] = len(ind.rules)
+            for idx_rule, r in enumerate(ind.rules):
+                rules[idx_ind, idx_rule, 0:2] = r.head
+                for idx_atom, a in enumerate(r.body):
+                    rules[idx_ind, idx_rule, 2 + 2*idx_atom:4 + 2*idx_atom] = a
+        return rules, n_rules
+
+    def _decode(self, rules : np.ndarray, n_rules : np.ndarray) -> 'list[Individual]':
+        """
+        Individuals from the array encoding.
+        """
+        individuals : 'list[Individual]' = []
+        for rules_ind, n in zip(rules.tolist(), n_rules.tolist()):
+            current_rules : 'list[Rule]' = []
+            for r in rules_ind[:n]:
+                body = [[r[i], r[i + 1]] for i in range(2, len(r), 2) if r[i] != PAD]
+                rule = Rule(self.head_candidates, self.body_candidates, len(body), r[0:2], body)
+                if self.normaliser is not None:
+                    rule.normalise(self.normaliser)
+                current_rules.append(rule)
+            individuals.append(Individual(current_rules))
+        return individuals
+
+    def _generate_offspring_batch(self, parents : 'list[tuple[Individual,Individual]]') -> 'list[Individual]':
+        """
+        Crossover and mutation of all the pairs of parents at once with
+        the batch operators.
+        """
+        max_rules = max(max(len(i0.rules), len(i1.rules)) for i0, i1 in parents)
+        max_body = max([self.options.max_initial_rule_length] + [len(r.body) for p in parents for i in p for r in i.rules])
+        rules0, n_rules0 = self._encode([p[0] for p in parents], max_rules, max_body)
+        rules1, n_rules1 = self._encode([p[1] for p in parents], max_rules, max_body)
+
+        self.batch_operators.rng = self.streams.get_generator("batch", self.iteration)
+        child01, n01, child10, n10 = self.batch_operators.crossover(rules0, n_rules0, rules1, n_rules1)
+        # interleave the children, to keep the order of the non batch version
+        children = np.stack([child01, child10], axis=1).reshape(-1, *child01.shape[1:])
+        n_children = np.stack([n01, n10], axis=1).reshape(-1)
+
+        for op in ["add_rule", "drop_rule", "modify", "change_atom", "change_instantiation"]:
+            setattr(self.batch_operators, f"prob_{op}", self.rates[op])
+        children, n_children = self.batch_operators.mutate(children, n_children)
+        offspring = self._decode(children, n_children)
+        for op, mask in self.batch_operators.applied.items():
+            for ind, was_applied in zip(offspring, mask.tolist()):
+                if was_applied:
+                    ind.operators.append(op)
+        return offspring
+
+    def _generate_offspring(self) -> 'list[Individual]':
+        """
+        Selection, crossover, and mutation: returns the offspring of
+        the current iteration.
+        """
+        rng = self.streams.get_random("selection", self.iteration)
+        crossover_types = [self.options.crossover_type] * self.options.offspring_pairs
+        if self.operator_rates is not None:
+            crossover_types = rng.choices(CROSSOVER_TYPES, [self.rates[ct] for ct in CROSSOVER_TYPES], k=self.options.offspring_pairs)
+        parents = [self._select_individuals(rng, ct) for ct in crossover_types]
+        self._show_individuals(3, "Selected for crossover", "selected", [i for p in parents for i in p])
+
+        if self.batch_operators is not None:
+            offspring = self._generate_offspring_batch(parents)
+            self._show_individuals(3, "Obtained from crossover and mutation", "offspring", offspring)
+            if self.options.warm_start:
+                self._inherit_probabilities(offspring, parents)
+            if self.operator_rates is not None:
+                self._record_parents(offspring, parents, crossover_types)
+            return offspring
+
+        offspring : 'list[Individual]' = []
+        for idx_pair, (i0, i1) in enumerate(parents):
+            # each pair has its own stream, so the offspring can be
+            # generated independently
+            rng = self.streams.get_random("offspring", self.iteration, idx_pair)
+            # crossover
+            i0, i1 = self._crossover(i0,i1,rng)
+            self._show_individuals(3, "Obtained from crossover", "crossover", [i0, i1])
+            
+            # mutate - crucial the deepcopy, since _mutate modifies the input class
+            if self.options.verbosity >= 3:
+                print("Mutation step")
+            offspring.append(self._mutate(copy.deepcopy(i0), rng))
+            offspring.append(self._mutate(copy.deepcopy(i1), rng))
+        
+        if self.options.warm_start:
+            self._inherit_probabilities(offspring, parents)
+        if self.operator_rates is not None:
+            self._record_parents(offspring, parents, crossover_types)
+        return offspring
+
+    def _record_parents(self, offspring : 'list[Individual]', parents : 'list[tuple[Individual,Individual]]', crossover_types : 'list[str]') -> None:
+        """
+        Stores in the offspring (the children of the i-th pair are in
+        positions 2i and 2i+1) the crossover type and the best score of
+        the parents, to credit the operators after the evaluation.
+        """
+        for idx, ind in enumerate(offspring):
+            i0, i1 = parents[idx // 2]
+            ind.parent_score = max(i0.score, i1.score)
+            ind.operators.append(crossover_types[idx // 2])
+
+    def _replace(self, ind_list : 'list[Individual]') -> None:
+        """
+        Inserts the evaluated offspring in the population, according to
+        the replacement strategy:
+        - worst: drop the worst individuals (or the oldest, with the age
+            regularization)
+        - sharing: drop the individuals with the worst shared fitness
+        - crowding: each offspring replaces its most similar individual,
+            if better
+        """
+        if self.options.replacement == "crowding":
+            for ind in ind_list:
+                nearest, _ = self.diversity.get_nearest(ind)
+                if nearest is None:
+                    # no individual shares a rule: compete with the worst
+                    nearest = self.population[-1]
+                if ind.score > nearest.score:
+                    self._show_individuals(3, "Replaced by crowding", "dropped", [nearest])
+                    self.population.remove(nearest)
+                    self.diversity.remove(nearest)
+                    self.population.append(ind)
+                    self.diversity.add(ind)
+            self.population.sort(reverse=True)
+            return
+
+        self.population = self.population + ind_list
+        self.population.sort(reverse=True)
+        for ind in ind_list:
+            self.diversity.add(ind)
+        
+        if self.options.replacement == "sharing":
+            for _ in range(len(ind_list)):
+                worst_index = int(np.argmin([self.diversity.get_shared_fitness(x) for x in self.population]))
+                dropped = self.population.pop(worst_index)
+                self.diversity.remove(dropped)
+                self._show_individuals(3, "Dropped by fitness sharing", "dropped", [dropped])
+            return
+
+        # drop exceeding elements
+        self._show_individuals(3, "Dropping after insertion", "dropped", self.population[-len(ind_list):] if len(ind_list) > 0 else [])
+        
+        # standard: drop the worst scores
+        # age regularized: drop the oldest
+        rng = self.streams.get_random("replacement", self.iteration)
+        for i in range(len(ind_list)):
+            if rng.random() < self.options.age_regularized_prob:
+                oldest_index = np.argmin([x.birth_time for x in self.population])
+                dropped = self.population.pop(oldest_index)
+            else:
+                dropped = self.population.pop()
+            self.diversity.remove(dropped)
+
     def run_genetic_loop(self) -> Individual:
         """
         Runs the genetic loop.
@@ -397,71 +978,108 @@ class GeneticAlgorithm:
         
         for it in range(self.options.number_of_evolutionary_cycles + 1):
         # for it in range(10):
+            self.iteration = it
+            if self.governor is not None and self.governor.check(it):
+                self._shrink_population()
+            if self.logger is not None:
+                self.logger.log(
+                    "iteration",
+                    iteration=it,
+                    best_score=self.population[0].score,
+                    evaluations=self.statistics["evaluations"],
+                    mean_distance=self.diversity.get_mean_distance()
+                )
             if self.options.verbosity >= 1 and it % self.options.iterations_print_step == 0:
                 best_score = self.population[0].score
                 print(f"Iteration: {it}. Best individual with score: {best_score}")
-            # select two individuals
-            i0, i1 = self._select_individuals()
-            if self.options.verbosity >= 3:
-                print("Selected for crossover")
-                print(i0)
-                print(i1)
+                print(self.diversity)
+                if self.governor is not None:
+                    print(self.governor)
+                if self.surrogate is not None:
+                    print(self.surrogate)
+                if self.operator_rates is not None:
+                    print(self.operator_rates)
+            # select pairs of individuals, crossover, and mutation
+            ind_list = self._generate_offspring()
             
-            # crossover
-            i0, i1 = self._crossover(i0,i1)
-            if self.options.verbosity >= 3:
-                print("Obtained from crossover")
-                print(i0)
-                print(i1)
-            
-            # mutate - crucial the deepcopy, since _mutate modifies the input class
-            if self.options.verbosity >= 3:
-                print("Mutation step")
-            i0 = self._mutate(copy.deepcopy(i0))
-            i1 = self._mutate(copy.deepcopy(i1))
+            if self.coverage is not None:
+                n_offspring = len(ind_list)
+                ind_list = self.coverage.prescreen(ind_list)
+                if self.options.verbosity >= 3 and len(ind_list) < n_offspring:
+                    print(f"Coverage index: discarded {n_offspring - len(ind_list)} offspring")
             
             # evaluate
             if self.options.verbosity >= 3:
                 print("Evaluation step")
-            ind_list = [i0,i1]
-            l = [ir.get_individual_as_input_program() for ir in ind_list]
-            # print(l)
-            ll_ind = self.prolog_int.compute_ll_rules(l, self.options.train_set)
-
-            # subtract regularization since the LL is neg
-            for (ll,sum_p), idx in zip(ll_ind, range(len(ind_list))):
-                # ind_list[idx].score = ll - self.options.regularization_score*ind_list[idx].complexity
-                ind_list[idx].score = ll - self.options.regularization_score*sum_p
+            filtered = False
+            if self.surrogate is not None:
+                filtered = self.surrogate.is_trained()
+                n_offspring = len(ind_list)
+                ind_list = self.surrogate.select(ind_list)
+                if self.options.verbosity >= 3 and len(ind_list) < n_offspring:
+                    print(f"Surrogate: skipped {n_offspring - len(ind_list)} offspring")
+            
+            # worst score before the insertion, to check the surrogate
+            worst_score = self.population[-1].score
+            evaluated = self._evaluate(ind_list)
+            if filtered:
+                for ind in ind_list:
+                    self.surrogate.record_outcome(ind, worst_score)
+            if self.operator_rates is not None:
+                self.operator_rates.update(ind_list, set(ind.birth_time for ind in evaluated))
                 
             # replace
-            self.population = self.population + ind_list
-            self.population.sort(reverse=True)
-            
-            # drop exceeding elements
-            if self.options.verbosity >= 3:
-                print("Dropping after insertion")
-                for i in range(1, len(ind_list) + 1):
-                    print(self.population[len(self.population) - i])
-            
-            # standard: drop the worst scores
-            # age regularized: drop the oldest
-            for i in range(len(ind_list)):
-                if random.random() < self.options.age_regularized_prob:
-                    oldest_index = np.argmin([x.birth_time for x in self.population])
-                    self.population.pop(oldest_index)
-                else:
-                    self.population = self.population[:-1]
+            self._replace(ind_list)
         
         if self.options.verbosity >= 2:
-            print("Final population")
-            for i in self.population:
-                print(i)
-                print(i.get_individual_as_input_program())
+            if self.logger is not None:
+                self.logger.log_individuals("final_population", self.population)
+            else:
+                print("Final population")
+                for i in self.population:
+                    print(i)
+                    print(i.get_individual_as_input_program())
             
         # print(*self.population)
         
+        if isinstance(self.evaluator, ParallelEvaluator):
+            self.evaluator.close()
+        
         elapsed_time = time.time() - start_time
+        self.statistics["elapsed_time"] = elapsed_time
+        self.statistics["mean_distance"] = self.diversity.get_mean_distance()
+        self.statistics["distinct_rules"] = self.diversity.get_number_of_distinct_rules()
+        if self.normaliser is not None:
+            self.statistics["observed_collapse_ratio"] = self.normaliser.get_observed_collapse_ratio()
+            self.statistics["single_atom_collapse_ratio"] = self.normaliser.get_single_atom_collapse_ratio()
+        if self.governor is not None:
+            self.statistics.update(self.governor.get_statistics())
+        if self.operator_rates is not None:
+            self.statistics.update(self.operator_rates.get_statistics())
+        if self.coverage is not None:
+            self.statistics["coverage_prescreened"] = self.coverage.prescreened
+        if self.surrogate is not None:
+            self.statistics["surrogate_evaluations_saved"] = self.surrogate.skipped
+            self.statistics["surrogate_precision"] = self.surrogate.get_precision()
         if self.options.verbosity >= 1:
             print(f"Terminated evolutionary loop in {elapsed_time} second")
+            print(f"Evaluations: {self.statistics['evaluations']}")
+            if self.normaliser is not None:
+                print(f"Cache hits: {self.statistics['cache_hits']}")
+                print(f"Collapse ratio of the rules: {self.statistics['observed_collapse_ratio']:.3f} (observed), {self.statistics['single_atom_collapse_ratio']:.3f} (rules with one body atom)")
+            print(self.diversity)
+            if self.coverage is not None:
+                print(f"Coverage index: discarded {self.coverage.prescreened} offspring")
+            if self.surrogate is not None:
+                print(self.surrogate)
+            if self.options.warm_start:
+                self._print_warm_start_statistics()
+            if self.operator_rates is not None:
+                print(self.operator_rates)
+
+        if self.logger is not None:
+            self.logger.log("best", score=self.population[0].score, rules=[[r.head, r.body] for r in self.population[0].rules])
+            self.logger.log("statistics", **self.statistics)
+            self.logger.close()
 
         return self.population[0]
\ No newline at end of file
@@ -0,0 +1,98 @@
+import math
+
+# mutations: each one is applied independently with its own
+# probability, adapted within a factor of the configured one
+MUTATIONS : 'list[str]' = ["add_rule", "drop_rule", "modify", "change_atom", "change_instantiation"]
+# crossover types (selection of the parents): one is chosen for each
+# pair, so they share the probability mass; tournament is not
+# implemented
+CROSSOVER_TYPES : 'list[str]' = ["random", "fittest", "rank"]
+
+
+class AdaptiveOperatorRates:
+    """
+    Adaptive operator rates.
+    Each offspring records the operators that produced it (crossover
+    type and the mutations actually applied). After the evaluation, each
+    operator gets as reward the score gain of its offspring over the best
+    parent (0 if worse) per Prolog evaluation, and its quality is an
+    exponential moving average of the rewards.
+    The probability of a mutation is its configured one multiplied by
+    its quality relative to the mean quality of the mutations, bounded in
+    [configured / max_factor, configured * max_factor] (and the change
+    atom and change instantiation probabilities, alternatives for the
+    same body atom, sum at most to 1).
+    The crossover types are chosen by probability matching:
+        min_share + (1 - k*min_share) * quality / sum of the qualities
+    where k is the number of types, so no type disappears.
+    Until some operator gets a reward, the rates are the initial ones.
+    """
+    def __init__(self,
+            initial_rates : 'dict[str, float]',
+            adaptation_rate : float = 0.3,
+            min_share : float = 0.05,
+            max_factor : float = 2
+        ) -> None:
+        self.rates : 'dict[str, float]' = dict(initial_rates)
+        self.initial_rates : 'dict[str, float]' = dict(initial_rates)
+        self.adaptation_rate = adaptation_rate
+        self.min_share = min_share
+        self.max_factor = max(1.0, max_factor)
+        self.quality : 'dict[str, float]' = {o : 0 for o in initial_rates}
+        # offspring and evaluations credited to each operator
+        self.applications : 'dict[str, int]' = {o : 0 for o in initial_rates}
+        self.evaluations : 'dict[str, int]' = {o : 0 for o in initial_rates}
+        self.total_gain : 'dict[str, float]' = {o : 0 for o in initial_rates}
+
+    def update(self, offspring : list, evaluated : 'set[int]') -> None:
+        """
+        Credits the evaluated offspring to their operators and updates
+        the rates. evaluated contains the birth times of the offspring
+        sent to the backend (the other ones were found in the cache and
+        cost no evaluation).
+        """
+        gains : 'dict[str, float]' = {}
+        evaluations : 'dict[str, int]' = {}
+        for ind in offspring:
+            gain = 0.0
+            if ind.parent_score is not None and math.isfinite(ind.score) and math.isfinite(ind.parent_score):
+                gain = max(0.0, ind.score - ind.parent_score)
+            for op in set(ind.operators):
+                gains[op] = gains.get(op, 0) + gain
+                evaluations[op] = evaluations.get(op, 0) + (ind.birth_time in evaluated)
+                self.applications[op] += 1
+                self.total_gain[op] += gain
+
+        for op, gain in gains.items():
+            self.evaluations[op] += evaluations[op]
+            reward = gain / max(1, evaluations[op])
+            self.quality[op] += self.adaptation_rate * (reward - self.quality[op])
+
+        mean_quality = sum(self.quality[o] for o in MUTATIONS) / len(MUTATIONS)
+        if mean_quality > 0:
+            for o in MUTATIONS:
+                factor = min(max(self.quality[o] / mean_quality, 1 / self.max_factor), self.max_factor)
+                self.rates[o] = min(1.0, self.initial_rates[o] * factor)
+            sum_changes = self.rates["change_atom"] + self.rates["change_instantiation"]
+            if sum_changes > 1:
+                self.rates["change_atom"] /= sum_changes
+                self.rates["change_instantiation"] /= sum_changes
+
+        sum_quality = sum(self.quality[o] for o in CROSSOVER_TYPES)
+        if sum_quality > 0:
+            share = 1 - len(CROSSOVER_TYPES) * self.min_share
+            for o in CROSSOVER_TYPES:
+                self.rates[o] = self.min_share + share * self.quality[o] / sum_quality
+
+    def get_statistics(self) -> 'dict[str, float]':
+        """
+        Learned rates and mean gain per evaluation of each operator.
+        """
+        stats : 'dict[str, float]' = {}
+        for o in self.rates:
+            stats[f"rate_{o}"] = self.rates[o]
+            stats[f"gain_per_evaluation_{o}"] = self.total_gain[o] / max(1, self.evaluations[o])
+        return stats
+
+    def __str__(self) -> str:
+        return "Operator rates: " + ", ".join(f"{o} {r:.3f}" for o, r in self.rates.items())
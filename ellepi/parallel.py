@@ -0,0 +1,143 @@
+import concurrent.futures
+import multiprocessing
+import os
+
+from .prolog_interface import PrologInterface
+from .resources import get_rss
+
+# PrologInterface of the worker process
+_worker_prolog : 'PrologInterface | None' = None
+
+
+def _init_worker(
+        bg_text : str,
+        backend : str,
+        stack_limit : int,
+        table_space : int,
+        seed : 'int | None'
+    ) -> None:
+    global _worker_prolog
+    _worker_prolog = PrologInterface(
+        "",
+        backend,
+        0,
+        bg_text=bg_text,
+        stack_limit=stack_limit,
+        table_space=table_space,
+        seed=seed
+    )
+
+
+def _evaluate_chunk(
+        r_list : 'list[str]',
+        folds : 'list[str]',
+        return_probs : bool,
+        collect_garbage : bool
+    ) -> 'tuple[list[list], list[float], int, dict[str, int]]':
+    """
+    Evaluates the programs, after the garbage collection if requested.
+    Also returns the pid and the memory of the worker (Prolog statistics
+    and RSS), for the memory governor.
+    """
+    if collect_garbage:
+        _worker_prolog.collect_garbage()
+    res = _worker_prolog.compute_ll_rules(r_list, folds, return_probs)
+    memory = _worker_prolog.get_memory_statistics()
+    memory["rss"] = get_rss()
+    return res, _worker_prolog.query_times, os.getpid(), memory
+
+
+class ParallelEvaluator:
+    """
+    Computes the LL of the programs with a pool of worker processes, each
+    one with its own SWI-Prolog engine (janus embeds one engine per
+    process). It has the same interface of PrologInterface for the
+    evaluation; the other queries go to the engine of the main process.
+    The programs are split in contiguous chunks and the results are
+    reassembled in the order of the input (for the seeding of Prolog see
+    PrologInterface.__init__).
+    The workers report their memory with the results, and the garbage
+    collection requested with collect_garbage runs in each worker at its
+    next chunk, so the memory governor covers the workers too.
+    """
+    def __init__(self, prolog_int : PrologInterface, workers : int) -> None:
+        self.prolog_int = prolog_int
+        self.workers = workers
+        self.query_times : 'list[float]' = []
+        # last memory sample of each worker, by pid
+        self.worker_memory : 'dict[int, dict[str, int]]' = {}
+        self.gc_pending : bool = False
+        self.pool : 'concurrent.futures.ProcessPoolExecutor | None' = None
+        self._start_pool()
+
+    def _start_pool(self) -> None:
+        self.pool = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.workers,
+            # fork would copy the Prolog engine of the main process
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(
+                self.prolog_int.bg_text,
+                self.prolog_int.backend,
+                self.prolog_int.stack_limit,
+                self.prolog_int.table_space,
+                self.prolog_int.seed
+            )
+        )
+
+    def recycle(self) -> None:
+        """
+        Restarts the worker processes, to release their memory.
+        """
+        self.pool.shutdown()
+        self.worker_memory = {}
+        self.gc_pending = False
+        self._start_pool()
+
+    def close(self) -> None:
+        self.pool.shutdown()
+
+    def compute_ll_rules(self, r_list : 'list[str]', folds : 'list[str]', return_probs : bool = False) -> 'list[list]':
+        """
+        As PrologInterface.compute_ll_rules, distributing the programs
+        among the workers.
+        """
+        chunk_size = max(1, -(-len(r_list) // self.workers))
+        chunks = [r_list[i:i + chunk_size] for i in range(0, len(r_list), chunk_size)]
+        futures = [self.pool.submit(_evaluate_chunk, c, folds, return_probs, self.gc_pending) for c in chunks]
+        self.gc_pending = False
+
+        results : 'list[list]' = []
+        self.query_times = []
+        # in the order of submission, not of completion
+        for f in futures:
+            res, times, pid, memory = f.result()
+            results.extend(res)
+            self.query_times.extend(times)
+            self.worker_memory[pid] = memory
+        return results
+
+    def collect_garbage(self) -> None:
+        """
+        Garbage collection of the main engine now, and of the workers
+        before their next chunk.
+        """
+        self.prolog_int.collect_garbage()
+        self.gc_pending = True
+
+    def get_memory_statistics(self) -> 'dict[str, int]':
+        """
+        Prolog memory of the main engine plus the last sample of each
+        worker, with the total RSS of the workers as workers_rss.
+        """
+        s = dict(self.prolog_int.get_memory_statistics())
+        for memory in self.worker_memory.values():
+            for k in s:
+                s[k] += memory[k]
+        s["workers_rss"] = sum(memory["rss"] for memory in self.worker_memory.values())
+        return s
+
+    def __getattr__(self, name : str):
+        # the other methods (modes, coverage, memory, test) are run by the
+        # engine of the main process
+        return getattr(self.prolog_int, name)
@@ -1,6 +1,17 @@
 import sys
+import time
+import zlib
 
-import janus_swi as janus
+# janus_swi starts the embedded SWI-Prolog when imported, so it is
+# imported only when the first PrologInterface is built
+janus = None
+
+def _load_janus():
+    global janus
+    if janus is None:
+        import janus_swi
+        janus = janus_swi
+    return janus
 
 class PrologInterface:
     """
@@ -10,15 +21,46 @@ class PrologInterface:
             self,
             bg : str,
             backend : str,
-            verbosity : int = 0
+            verbosity : int = 0,
+            bg_text : str = "",
+            consulted : bool = False,
+            stack_limit : int = 0,
+            table_space : int = 0,
+            seed : 'int | None' = None
         ) -> None:
+        """
+        The background knowledge (with modes, folds, and examples) is
+        read from the file bg, or taken from bg_text if bg is empty.
+        If consulted is True, it is assumed to be already loaded in the
+        Prolog engine, and only the code used by the interface is
+        consulted.
+        stack_limit and table_space (MB, 0 to keep the default of
+        SWI-Prolog) bound the Prolog stacks and the space for tables.
+        If seed is not None, the Prolog random generator is seeded before
+        learning each program with crc32(program) xor seed, so the result
+        of a program does not depend on the programs learned before it,
+        nor on the process (or worker) that learns it.
+        """
+        _load_janus()
         self.verbosity = verbosity
         self.backend = backend
+        # time spent for each program in the last call of compute_ll_rules
+        self.query_times : 'list[float]' = []
+        self.stack_limit = stack_limit
+        self.table_space = table_space
+        self.seed = seed
 
         # read bg knowledge
-        f = open(bg, "r")
-        lines_bg = f.read()
-        f.close()
+        if consulted:
+            lines_bg = ""
+        elif bg != "":
+            f = open(bg, "r")
+            lines_bg = f.read()
+            f.close()
+        else:
+            lines_bg = bg_text
+        # to build other engines with the same background (parallel.py)
+        self.bg_text = lines_bg
 
         predicate_induce = "induce_par" if self.backend == "SLIPCOVER" else "induce_par_lift"
         predicate_test = "test" if self.backend == "SLIPCOVER" else "test_lift"
@@ -26,9 +68,40 @@ class PrologInterface:
         ll_code = GET_LL_CODE.replace("__PREDICATE_INDUCE__", predicate_induce).replace("__PREDICATE_TEST__", predicate_test)
         test_code = GET_TEST_RESULTS_CODE.replace("__PREDICATE_INDUCE__", predicate_induce).replace("__PREDICATE_TEST__", predicate_test)
 
-        self.lines_bg = lines_bg + GET_MODE_CODE + ll_code + test_code
+        self.lines_bg = lines_bg + GET_MODE_CODE + ll_code + test_code + COVERAGE_CODE + MEMORY_CODE
+        
+        janus.consult("ellepi_code" if consulted else "bg", self.lines_bg)
+        self.set_limits(stack_limit, table_space)
         
-        janus.consult("bg", self.lines_bg)
+    def set_limits(self, stack_limit : int, table_space : int) -> None:
+        """
+        Sets the limits (MB, 0 to leave unchanged) of the Prolog stacks
+        and table space.
+        """
+        if stack_limit > 0:
+            self._query_prolog(f"set_prolog_flag(stack_limit, {stack_limit*1024*1024}).", True)
+        if table_space > 0:
+            self._query_prolog(f"set_prolog_flag(table_space, {table_space*1024*1024}).", True)
+
+    def collect_garbage(self) -> None:
+        """
+        Removes the asserted programs and runs the garbage collection of
+        stacks, atoms, and clauses.
+        """
+        self._query_prolog("retractall(in(_)), garbage_collect, garbage_collect_atoms, garbage_collect_clauses.", True)
+
+    def get_memory_statistics(self) -> 'dict[str, int]':
+        """
+        Memory used on the Prolog side: stacks and tables (bytes), and
+        number of atoms and clauses.
+        """
+        res = janus.query_once("get_memory_statistics(Stack,Table,Atoms,Clauses).")
+        return {
+            "stack" : res["Stack"],
+            "table_space" : res["Table"],
+            "atoms" : res["Atoms"],
+            "clauses" : res["Clauses"]
+        }
     
         
     def _query_prolog(self, query : str, expected : bool, return_var : str = ""):
@@ -56,9 +129,12 @@ class PrologInterface:
         return modeh, modeb
         
 
-    def _query_for_ll(self, in_p : str, folds : 'list[str]') -> 'list[float]':
+    def _query_for_ll(self, in_p : str, folds : 'list[str]', return_probs : bool = False) -> list:
         """
-        Query prolog for LL.
+        Query prolog for LL. If return_probs is True, the learned
+        probabilities of the rules are returned as third element.
+        The initial probabilities of the rules (used as starting point
+        of parameter learning) are the ones in the program in_p.
         """
         # janus.consult("bg", self.lines_bg + f"\n{in_p}\n")
     
@@ -73,24 +149,74 @@ class PrologInterface:
         else:
             train_set = ','.join(folds)
 
-        ll_and_sum_probs = self._query_prolog(f"get_lls(LLPList, [{train_set}]).", True, "LLPList")
+        if self.seed is not None:
+            program_seed = zlib.crc32(in_p.encode()) ^ (self.seed & 0xFFFFFFFF)
+            self._query_prolog(f"set_random(seed({program_seed})).", True)
+
+        try:
+            if return_probs:
+                return self._query_prolog(f"get_lls_probs(LLPList, [{train_set}]).", True, "LLPList")
+
+            ll_and_sum_probs = self._query_prolog(f"get_lls(LLPList, [{train_set}]).", True, "LLPList")
+        except janus.PrologError as e:
+            if "resource_error" not in str(e):
+                raise
+            # out of stack or table space: the program gets the worst
+            # score instead of stopping the run
+            print(f"Resource error in computing the LL of {in_p}: {e}")
+            self.collect_garbage()
+            return [float("-inf"), 0, []] if return_probs else [float("-inf"), 0]
         
         return ll_and_sum_probs
         
 
-    def compute_ll_rules(self, r_list : 'list[str]', folds : 'list[str]') -> 'list[list[float]]':
+    def compute_ll_rules(self, r_list : 'list[str]', folds : 'list[str]', return_probs : bool = False) -> 'list[list]':
         """
-        Computes the LL of the rules.
+        Computes the LL of the rules: a list [LL, sum of the probabilities]
+        for each program, with also the list of the learned probabilities
+        if return_probs is True.
         """
         # alternative with multiple in/1
         # return self._query_for_ll('\n'.join(r_list), train_or_test)
-        ll_list_sum_probs : 'list[list[float]]' = []
+        ll_list_sum_probs : 'list[list]' = []
+        self.query_times = []
         for r in r_list:
-            res = self._query_for_ll(r, folds)
+            start_time = time.time()
+            res = self._query_for_ll(r, folds, return_probs)
+            self.query_times.append(time.time() - start_time)
             ll_list_sum_probs.append(res)
         
         return ll_list_sum_probs
     
+    def get_number_of_examples(self, head : str, folds : 'list[str]', negative : bool = False) -> int:
+        """
+        Number of positive (true in a model) or negative (neg/1) examples
+        of the predicate of head in the folds.
+        """
+        if folds[0] == "train":
+            fold_set = "train"
+        else:
+            fold_set = ','.join(folds)
+        kind = "neg" if negative else "pos"
+        return self._query_prolog(f"number_of_examples('{head}',{kind},[{fold_set}],N).", True, "N")
+
+    def get_coverage_mask(self, head : str, body : str, folds : 'list[str]', negative : bool = False) -> int:
+        """
+        Bitset (as int) of the examples of the predicate of head (see
+        get_number_of_examples) covered by the rule head :- body, where
+        head and body are possible instantiations of the modes (body
+        can be true): the example unifies with head and body has a true
+        grounding in the model of the example. The i-th bit corresponds
+        to the i-th example.
+        """
+        if folds[0] == "train":
+            fold_set = "train"
+        else:
+            fold_set = ','.join(folds)
+        kind = "neg" if negative else "pos"
+        mask = self._query_prolog(f"coverage_mask('({head}:-{body})',{kind},[{fold_set}],Mask).", True, "Mask")
+        return int(mask, 16)
+
     def compute_test_results(self, in_p : str, train_folds : 'list[str]', test_folds : 'list[str]'):
         """
         Computes test results.
@@ -143,14 +269,21 @@ GET_LL_CODE = """
 :- style_check(-singleton).
 
 get_prob((_:P;_:-_),P).
+get_prob((_:P:-_),P).
 
 get_ll(LL,SumProbs,Fold):-
+  get_ll(LL,SumProbs,_,Fold).
+
+get_ll(LL,SumProbs,ProbList,Fold):-
   % in(P),test(P,Fold,LL,_,_,_,_).
   % induce_par(Fold,P),
   __PREDICATE_INDUCE__(Fold,P),
   __PREDICATE_TEST__(P,Fold,LL,_,_,_,_),
   maplist(get_prob, P, ProbList),
   sum_list(ProbList, SumProbs).
+
+get_lls_probs([LL,SumProbs,ProbList],Fold):-
+  get_ll(LL,SumProbs,ProbList,Fold), !.
   
 
 get_lls(LLPListFlat,Fold):-
@@ -165,4 +298,76 @@ get_test_results(PS,TrainFolds,TestFolds,LL,AUCROC,AUCPR):-
     __PREDICATE_INDUCE__(TrainFolds,P),
     __PREDICATE_TEST__(P,TestFolds,LL,AUCROC,_,AUCPR,_),
     term_string(P,PS).
-"""
\ No newline at end of file
+"""
+
+
+COVERAGE_CODE = """
+get_models(Folds,Models):-
+    findall(M,(member(F,Folds),fold(F,L),member(M,L)),Models0),
+    list_to_set(Models0,Models).
+
+% the model is the first argument of the atoms of the examples
+in_model(Atom,M,pos):-
+    Atom =.. [F|Args],
+    AtomM =.. [F,M|Args],
+    (   catch(\\+ \\+ call(AtomM),_,fail) -> true ;
+        catch(\\+ \\+ call(Atom),_,fail)
+    ).
+
+% examples (Model-Atom) of the predicate F/N in the models of the folds:
+% positive if true in the model, negative if neg/1
+:- dynamic cached_examples/4.
+get_examples(F/N,Kind,Folds,Examples):-
+    cached_examples(F/N,Kind,Folds,Examples), !.
+get_examples(F/N,Kind,Folds,Examples):-
+    get_models(Folds,Models),
+    functor(Atom,F,N),
+    findall(M-Atom,(member(M,Models),example_in_model(Atom,M,Kind)),Examples0),
+    list_to_set(Examples0,Examples),
+    assertz(cached_examples(F/N,Kind,Folds,Examples)).
+
+example_in_model(Atom,M,pos):-
+    Atom =.. [F|Args],
+    AtomM =.. [F,M|Args],
+    catch(call(AtomM),_,fail).
+example_in_model(Atom,M,neg):-
+    Atom =.. [F|Args],
+    AtomM =.. [F,M|Args],
+    catch(neg(AtomM),_,fail).
+
+number_of_examples(HeadString,Kind,Folds,N):-
+    term_string(Head,HeadString),
+    functor(Head,F,A),
+    get_examples(F/A,Kind,Folds,Examples),
+    length(Examples,N).
+
+% the body atoms are checked one by one: the variables shared among
+% them are ignored, the ones shared with the head are bound by the example
+covers_example((Head:-Body),M,Example):-
+    copy_term((Head:-Body),(Example:-Body1)),
+    forall(member(B,Body1), in_model(B,M,pos)).
+
+coverage_bit(Rule,M-Example,Mask0-I,Mask-I1):-
+    I1 is I + 1,
+    (   covers_example(Rule,M,Example) ->
+        Mask is Mask0 \\/ (1 << I) ;
+        Mask = Mask0
+    ).
+
+coverage_mask(RuleString,Kind,Folds,MaskString):-
+    term_string((Head:-Body0),RuleString),
+    ( Body0 == true -> Body = [] ; comma_list(Body0,Body) ),
+    functor(Head,F,N),
+    get_examples(F/N,Kind,Folds,Examples),
+    foldl(coverage_bit((Head:-Body)),Examples,0-0,Mask-_),
+    format(string(MaskString),"~16r",[Mask]).
+"""
+
+
+MEMORY_CODE = """
+get_memory_statistics(Stack,Table,Atoms,Clauses):-
+    statistics(stack,Stack),
+    (   catch(statistics(table_space_used,Table),_,fail) -> true ; Table = 0 ),
+    statistics(atoms,Atoms),
+    statistics(clauses,Clauses).
+"""
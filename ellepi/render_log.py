@@ -0,0 +1,84 @@
+import argparse
+import json
+
+from .variable_placer import Atom
+from .genetic import Rule, Individual
+
+
+def parse_args():
+    """
+    Arguments parser.
+    """
+    command_parser = argparse.ArgumentParser(
+        description="Renders the JSON lines log of an ELLEPI run as readable programs",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    command_parser.add_argument(
+        "log",
+        help="Log file (written with --log-file)",
+        type=str
+    )
+    command_parser.add_argument(
+        "--events",
+        help="Events to render (all if not specified)",
+        nargs="+",
+        default=[]
+    )
+    command_parser.add_argument(
+        "--input-program",
+        help="Render the individuals as input programs for the backend",
+        action="store_true"
+    )
+
+    return command_parser.parse_args()
+
+
+def decode_individual(
+        rules : 'list[list]',
+        head_candidates : 'list[Atom]',
+        body_candidates : 'list[Atom]',
+        score : float = 0
+    ) -> Individual:
+    """
+    Individual from the index encoding used in the log.
+    """
+    individual = Individual([Rule(head_candidates, body_candidates, len(b), h, b) for h, b in rules])
+    individual.score = score
+    return individual
+
+
+def main():
+    """
+    Main method.
+    """
+    args = parse_args()
+
+    head_candidates : 'list[Atom]' = []
+    body_candidates : 'list[Atom]' = []
+    fp = open(args.log, "r")
+    for line in fp:
+        if line.strip() == "":
+            continue
+        event = json.loads(line)
+        kind = event.pop("event")
+        event.pop("time", None)
+        if kind == "header":
+            head_candidates = [Atom(*a) for a in event.pop("head")]
+            body_candidates = [Atom(*a) for a in event.pop("body")]
+        if len(args.events) > 0 and kind not in args.events:
+            continue
+
+        if "rules" in event:
+            individual = decode_individual(event.pop("rules"), head_candidates, body_candidates, event.pop("score", 0))
+            print(f"[{kind}] " + ' '.join(f"{k}: {v}" for k, v in event.items()))
+            if args.input_program:
+                print(individual.get_individual_as_input_program())
+            else:
+                print(individual)
+        else:
+            print(f"[{kind}] " + ' '.join(f"{k}: {v}" for k, v in event.items()))
+    fp.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import json
+import math
+import re
+import time
+import zlib
+
+from .prolog_interface import PrologInterface
+
+# variables of a rule in the input program (anonymous variables excluded)
+VARIABLE = re.compile(r"\b[A-Z]\w*")
+
+
+def get_canonical_rules(in_p : str) -> 'list[str]':
+    """
+    Rules of an input program (as produced by
+    Individual.get_individual_as_input_program) with the variables
+    renamed in order of first occurrence, in the order of the program.
+    The initial probabilities are kept, since the learned parameters
+    (and so the LL) depend on them with warm start.
+    """
+    body = in_p.strip()
+    body = body[len("in([("):-len(")]).")]
+    rules : 'list[str]' = []
+    for r in body.split("),("):
+        names : 'dict[str, str]' = {}
+        rules.append(VARIABLE.sub(lambda m: names.setdefault(m.group(0), f"A{len(names)}"), r))
+    return rules
+
+
+def get_program_key(in_p : str, folds : 'list[str]') -> str:
+    """
+    Key of a program in a recording: its canonical rules, sorted, and
+    the folds.
+    """
+    return ','.join(folds) + "|" + ' '.join(sorted(get_canonical_rules(in_p)))
+
+
+def _folds_key(folds : 'list[str]') -> str:
+    return ','.join(folds)
+
+
+def new_recording(modeh : list, modeb : list) -> dict:
+    """
+    Empty recording for the given modes (as returned by
+    PrologInterface.get_modes).
+    """
+    return {
+        "modes" : [modeh, modeb],
+        "examples" : {},
+        "coverage" : {},
+        # key: [LL, sum of the probabilities, {canonical rule: learned
+        # probability}, learning time]
+        "programs" : {},
+        "test" : {}
+    }
+
+
+class RecordingBackend:
+    """
+    Wraps a PrologInterface and records the results of the queries of
+    the genetic algorithm (modes, examples, coverage, and LL, sum of the
+    probabilities, learned probabilities, and time of each program,
+    keyed by the canonical program) to be replayed by ReplayBackend.
+    The other methods are run by the wrapped interface.
+    """
+    def __init__(self, prolog_int : PrologInterface, filename : str) -> None:
+        self.prolog_int = prolog_int
+        self.filename = filename
+        self.recording : dict = new_recording(*prolog_int.get_modes())
+        self.query_times : 'list[float]' = []
+
+    def get_modes(self) -> 'tuple[list[list[str]], list[list[str]]]':
+        modeh, modeb = self.recording["modes"]
+        return modeh, modeb
+
+    def compute_ll_rules(self, r_list : 'list[str]', folds : 'list[str]', return_probs : bool = False) -> 'list[list]':
+        # probabilities always requested, to record them
+        res = self.prolog_int.compute_ll_rules(r_list, folds, True)
+        self.query_times = self.prolog_int.query_times
+        for in_p, r, t in zip(r_list, res, self.query_times):
+            learned = dict(zip(get_canonical_rules(in_p), r[2]))
+            self.recording["programs"][get_program_key(in_p, folds)] = [r[0], r[1], learned, t]
+        return res if return_probs else [r[:2] for r in res]
+
+    def get_number_of_examples(self, head : str, folds : 'list[str]', negative : bool = False) -> int:
+        n = self.prolog_int.get_number_of_examples(head, folds, negative)
+        self.recording["examples"][f"{_folds_key(folds)}|{head}|{negative}"] = n
+        return n
+
+    def get_coverage_mask(self, head : str, body : str, folds : 'list[str]', negative : bool = False) -> int:
+        mask = self.prolog_int.get_coverage_mask(head, body, folds, negative)
+        self.recording["coverage"][f"{_folds_key(folds)}|{head}:-{body}|{negative}"] = mask
+        return mask
+
+    def compute_test_results(self, in_p : str, train_folds : 'list[str]', test_folds : 'list[str]'):
+        res = self.prolog_int.compute_test_results(in_p, train_folds, test_folds)
+        self.recording["test"][get_program_key(in_p, train_folds + ["|"] + test_folds)] = list(res)
+        return res
+
+    def save(self) -> None:
+        """
+        Writes the recording (JSON) to the file. Non finite LLs (failed
+        programs) are stored as null.
+        """
+        for r in self.recording["programs"].values():
+            if not math.isfinite(r[0]):
+                r[0] = None
+        fp = open(self.filename, "w")
+        json.dump(self.recording, fp)
+        fp.close()
+
+    def __getattr__(self, name : str):
+        return getattr(self.prolog_int, name)
+
+
+class ReplayBackend:
+    """
+    Backend that replays a recording (see RecordingBackend), without
+    Prolog: the same programs always get the same results, so runs of
+    the genetic algorithm can be benchmarked and checked (evaluation
+    counts, throughput, timing) deterministically.
+    Each program costs latency seconds plus latency_scale times its
+    recorded learning time (injected with time.sleep, and reported in
+    query_times).
+    Programs not in the recording are handled according to on_miss:
+    "synthetic" gives them a deterministic pseudo random LL and
+    probabilities (crc32 of the canonical program), "error" raises
+    a ValueError. An empty recording with only the modes is thus
+    enough to run the algorithm.
+    """
+    def __init__(self,
+            recording : dict,
+            latency : float = 0,
+            latency_scale : float = 0,
+            on_miss : str = "synthetic",
+            backend : str = "SLIPCOVER"
+        ) -> None:
+        if on_miss not in ["synthetic", "error"]:
+            raise ValueError(f"on_miss must be synthetic or error, found {on_miss}")
+        self.recording = recording
+        self.latency = latency
+        self.latency_scale = latency_scale
+        self.on_miss = on_miss
+        # same attributes of PrologInterface used by the algorithm
+        self.backend = backend
+        self.verbosity = 0
+        self.bg_text = "" # no worker processes
+        self.seed = None
+        self.stack_limit = 0
+        self.table_space = 0
+        self.query_times : 'list[float]' = []
+        # statistics of the replay
+        self.evaluations : int = 0
+        self.hits : int = 0
+        self.misses : int = 0
+
+    @classmethod
+    def from_file(cls, filename : str, **kwargs) -> 'ReplayBackend':
+        """
+        Replay of a recording saved by RecordingBackend.save.
+        """
+        fp = open(filename, "r")
+        recording = json.load(fp)
+        fp.close()
+        return cls(recording, **kwargs)
+
+    def _miss(self, key : str) -> None:
+        self.misses += 1
+        if self.on_miss == "error":
+            raise ValueError(f"{key} is not in the recording")
+
+    def get_modes(self) -> 'tuple[list[list[str]], list[list[str]]]':
+        modeh, modeb = self.recording["modes"]
+        return modeh, modeb
+
+    def _get_program(self, in_p : str, folds : 'list[str]') -> 'tuple[float, float, list[float], float]':
+        """
+        LL, sum of the probabilities, learned probabilities (in the order
+        of the rules of in_p), and learning time of a program.
+        """
+        rules = get_canonical_rules(in_p)
+        key = get_program_key(in_p, folds)
+        if key in self.recording["programs"]:
+            self.hits += 1
+            ll, sum_p, learned, t = self.recording["programs"][key]
+            return (-math.inf if ll is None else ll), sum_p, [learned.get(r, 0.5) for r in rules], t
+        self._miss(key)
+        crc = zlib.crc32(key.encode())
+        probs = [(zlib.crc32(r.encode()) % 97) / 97 for r in rules]
+        return -(crc % 10000) / 100, sum(probs), probs, 0
+
+    def compute_ll_rules(self, r_list : 'list[str]', folds : 'list[str]', return_probs : bool = False) -> 'list[list]':
+        """
+        As PrologInterface.compute_ll_rules, with the recorded results.
+        """
+        results : 'list[list]' = []
+        self.query_times = []
+        for in_p in r_list:
+            ll, sum_p, probs, t = self._get_program(in_p, folds)
+            results.append([ll, sum_p, probs] if return_probs else [ll, sum_p])
+            self.query_times.append(self.latency + self.latency_scale * t)
+        self.evaluations += len(r_list)
+        if sum(self.query_times) > 0:
+            time.sleep(sum(self.query_times))
+        return results
+
+    def get_number_of_examples(self, head : str, folds : 'list[str]', negative : bool = False) -> int:
+        key = f"{_folds_key(folds)}|{head}|{negative}"
+        if key in self.recording["examples"]:
+            return self.recording["examples"][key]
+        self._miss(key)
+        return 64
+
+    def get_coverage_mask(self, head : str, body : str, folds : 'list[str]', negative : bool = False) -> int:
+        key = f"{_folds_key(folds)}|{head}:-{body}|{negative}"
+        if key in self.recording["coverage"]:
+            return self.recording["coverage"][key]
+        self._miss(key)
+        crc = zlib.crc32(key.encode())
+        mask = crc | (crc << 32)
+        return mask & (mask >> 7) & ((1 << self.get_number_of_examples(head, folds, negative)) - 1)
+
+    def compute_test_results(self, in_p : str, train_folds : 'list[str]', test_folds : 'list[str]'):
+        key = get_program_key(in_p, train_folds + ["|"] + test_folds)
+        if key in self.recording["test"]:
+            return tuple(self.recording["test"][key])
+        self._miss(key)
+        ll, _, _, _ = self._get_program(in_p, test_folds)
+        return in_p, ll, 0.5, 0.5
+
+    def set_limits(self, stack_limit : int, table_space : int) -> None:
+        pass
+
+    def collect_garbage(self) -> None:
+        pass
+
+    def get_memory_statistics(self) -> 'dict[str, int]':
+        return {"stack" : 0, "table_space" : 0, "atoms" : 0, "clauses" : 0}
+
+    def get_statistics(self) -> 'dict[str, int]':
+        return {"replay_evaluations" : self.evaluations, "replay_hits" : self.hits, "replay_misses" : self.misses}
@@ -0,0 +1,142 @@
+import os
+import sys
+
+from typing import Callable, TYPE_CHECKING
+
+from .prolog_interface import PrologInterface
+
+if TYPE_CHECKING:
+    from .parallel import ParallelEvaluator
+
+
+def get_rss() -> int:
+    """
+    Resident set size of the process (bytes). Uses /proc on Linux,
+    otherwise the peak RSS from getrusage.
+    """
+    try:
+        f = open("/proc/self/statm", "r")
+        pages = int(f.read().split()[1])
+        f.close()
+        return pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        # not available on Windows
+        return 0
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+class MemoryGovernor:
+    """
+    Periodically samples the memory of the process and of the Prolog
+    engine (stacks, tables, atoms, clauses), to find out which side
+    grows, and keeps it bounded: it runs the Prolog garbage collection
+    every gc_step iterations and, if the RSS exceeds max_rss (MB), runs
+    the garbage collection and the registered shrink callbacks (to empty
+    caches). If the RSS is still above the threshold, check() returns
+    True, to signal that the population should be reduced.
+    SWI-Prolog runs in the same process through janus, so the RSS
+    includes both sides. With a ParallelEvaluator, the samples include
+    the last ones reported by the workers (Prolog memory and RSS), and
+    the garbage collection also runs in the workers.
+    """
+    def __init__(self,
+            prolog_int : 'PrologInterface | ParallelEvaluator',
+            max_rss : int = 0,
+            gc_step : int = 0,
+            check_step : int = 10,
+            verbosity : int = 0
+        ) -> None:
+        self.prolog_int = prolog_int
+        self.max_rss = max_rss * 1024 * 1024
+        self.gc_step = gc_step
+        self.check_step = max(1, check_step)
+        self.verbosity = verbosity
+        self.shrink_callbacks : 'list[Callable[[], None]]' = []
+
+        self.last_sample : 'dict[str, int]' = {}
+        self.first_sample : 'dict[str, int]' = {}
+        self.peak_rss : int = 0
+        self.peak_prolog_stack : int = 0
+        self.degradations : int = 0
+        self.garbage_collections : int = 0
+
+    def register(self, callback : 'Callable[[], None]') -> None:
+        """
+        Registers a function called to free memory (e.g., to empty a
+        cache) when the RSS exceeds the threshold.
+        """
+        self.shrink_callbacks.append(callback)
+
+    def sample(self) -> 'dict[str, int]':
+        """
+        Memory of the process and of the Prolog engine.
+        """
+        s = self.prolog_int.get_memory_statistics()
+        s["rss"] = get_rss() + s.pop("workers_rss", 0)
+        self.peak_rss = max(self.peak_rss, s["rss"])
+        self.peak_prolog_stack = max(self.peak_prolog_stack, s["stack"])
+        if len(self.first_sample) == 0:
+            self.first_sample = s
+        self.last_sample = s
+        return s
+
+    def collect_garbage(self) -> None:
+        self.prolog_int.collect_garbage()
+        self.garbage_collections += 1
+
+    def check(self, iteration : int) -> bool:
+        """
+        Called at each iteration. Returns True if the RSS is above the
+        threshold even after the garbage collection and the shrink
+        callbacks.
+        """
+        if self.gc_step > 0 and iteration > 0 and iteration % self.gc_step == 0:
+            self.collect_garbage()
+        if iteration % self.check_step != 0:
+            return False
+
+        s = self.sample()
+        if self.max_rss <= 0 or s["rss"] <= self.max_rss:
+            return False
+
+        self.degradations += 1
+        if self.verbosity >= 1:
+            print(f"Memory: RSS {s['rss'] / 2**20:.1f} MB above {self.max_rss / 2**20:.1f} MB, freeing memory")
+        self.collect_garbage()
+        for callback in self.shrink_callbacks:
+            callback()
+        return self.sample()["rss"] > self.max_rss
+
+    def get_statistics(self) -> 'dict[str, float]':
+        """
+        Peaks and growth (between the first and the last sample) of the
+        memory of the two sides, in MB.
+        """
+        stats : 'dict[str, float]' = {
+            "peak_rss_mb" : self.peak_rss / 2**20,
+            "peak_prolog_stack_mb" : self.peak_prolog_stack / 2**20,
+            "memory_degradations" : self.degradations,
+            "prolog_garbage_collections" : self.garbage_collections
+        }
+        if len(self.first_sample) > 0:
+            rss_growth = self.last_sample["rss"] - self.first_sample["rss"]
+            prolog_growth = (self.last_sample["stack"] + self.last_sample["table_space"]) - (self.first_sample["stack"] + self.first_sample["table_space"])
+            stats["rss_growth_mb"] = rss_growth / 2**20
+            stats["prolog_growth_mb"] = prolog_growth / 2**20
+            # rough estimate, the RSS includes both sides
+            stats["python_growth_mb"] = (rss_growth - prolog_growth) / 2**20
+            stats["atoms_growth"] = self.last_sample["atoms"] - self.first_sample["atoms"]
+            stats["clauses_growth"] = self.last_sample["clauses"] - self.first_sample["clauses"]
+        return stats
+
+    def __str__(self) -> str:
+        if len(self.last_sample) == 0:
+            return "Memory: no sample"
+        s = self.last_sample
+        return f"Memory: RSS {s['rss'] / 2**20:.1f} MB, Prolog stack {s['stack'] / 2**20:.1f} MB, tables {s['table_space'] / 2**20:.1f} MB, atoms {s['atoms']}, clauses {s['clauses']}"
@@ -0,0 +1,37 @@
+import random
+
+import numpy as np
+
+# components of the algorithm with their own random streams
+COMPONENTS = ["population", "selection", "offspring", "batch", "replacement"]
+
+
+class RandomStreams:
+    """
+    Independent random streams spawned from a numpy SeedSequence: the
+    stream of a component, possibly indexed (for instance by iteration
+    and pair of parents, or by worker), is the SeedSequence with spawn
+    key (index of the component, *indices). So each stream depends only
+    on the seed and on its key, not on how many streams were created
+    before, and a run is reproducible for a given seed.
+    Prolog is seeded per program instead (see PrologInterface.__init__).
+    """
+    def __init__(self, seed : int) -> None:
+        self.seed = seed
+
+    def get_seed_sequence(self, component : str, *indices : int) -> np.random.SeedSequence:
+        return np.random.SeedSequence(self.seed, spawn_key=(COMPONENTS.index(component),) + indices)
+
+    def get_random(self, component : str, *indices : int) -> random.Random:
+        """
+        random.Random (same interface of the random module) for the
+        stream.
+        """
+        state = self.get_seed_sequence(component, *indices).generate_state(4)
+        return random.Random(int.from_bytes(state.tobytes(), "little"))
+
+    def get_generator(self, component : str, *indices : int) -> np.random.Generator:
+        """
+        numpy Generator for the stream.
+        """
+        return np.random.default_rng(self.get_seed_sequence(component, *indices))
@@ -0,0 +1,110 @@
+import json
+import random
+import time
+
+from typing import TYPE_CHECKING
+
+from .variable_placer import Atom
+
+if TYPE_CHECKING:
+    from .genetic import Individual
+
+
+class RunLogger:
+    """
+    Structured log of a run: one JSON object per line (JSON lines),
+    written through a buffer. Individuals are stored with the index
+    encoding of their rules ([head, body] for each rule, see Rule), so
+    they can be rendered offline as programs with render_log, using the
+    atoms stored in the header event.
+    Events about single individuals can be sampled (sample_rate) and rate
+    limited (max_individuals_per_second, 0 means no limit); the number of
+    dropped events is stored in the last event.
+    """
+    def __init__(self,
+            filename : str,
+            sample_rate : float = 1,
+            max_individuals_per_second : int = 0,
+            buffer_size : int = 1000
+        ) -> None:
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self.max_individuals_per_second = max_individuals_per_second
+        self.buffer_size = buffer_size
+        self.buffer : 'list[str]' = []
+        # own generator, so sampling does not change the random choices
+        # of the genetic algorithm
+        self.sampler = random.Random(0)
+        self.current_second : int = 0
+        self.events_current_second : int = 0
+        self.written : int = 0
+        self.dropped : int = 0
+        self.fp = open(filename, "w", buffering=1 << 20)
+
+    def log(self, event : str, **fields) -> None:
+        """
+        Logs an event (never sampled).
+        """
+        fields["event"] = event
+        fields["time"] = round(time.time(), 3)
+        self.buffer.append(json.dumps(fields, separators=(',', ':'), default=str))
+        self.written += 1
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def _accept(self) -> bool:
+        if self.sample_rate < 1 and self.sampler.random() >= self.sample_rate:
+            return False
+        if self.max_individuals_per_second > 0:
+            now = int(time.time())
+            if now != self.current_second:
+                self.current_second = now
+                self.events_current_second = 0
+            if self.events_current_second >= self.max_individuals_per_second:
+                return False
+            self.events_current_second += 1
+        return True
+
+    def log_individuals(self, event : str, individuals : 'list[Individual]', **fields) -> None:
+        """
+        Logs an event for each individual, subject to sampling and rate
+        limit. The approximate fitness is logged if the coverage index
+        computed it.
+        """
+        for ind in individuals:
+            if self._accept():
+                if ind.approximate_fitness is not None:
+                    self.log(event, score=ind.score, approximate_fitness=ind.approximate_fitness, rules=encode_individual(ind), **fields)
+                else:
+                    self.log(event, score=ind.score, rules=encode_individual(ind), **fields)
+            else:
+                self.dropped += 1
+
+    def log_header(self, head_candidates : 'list[Atom]', body_candidates : 'list[Atom]', **fields) -> None:
+        """
+        First event: the atoms, to decode the individuals.
+        """
+        self.log(
+            "header",
+            head=[[a.name, a.modes, a.number_of_variables] for a in head_candidates],
+            body=[[a.name, a.modes, a.number_of_variables] for a in body_candidates],
+            **fields
+        )
+
+    def flush(self) -> None:
+        if len(self.buffer) > 0:
+            self.fp.write('\n'.join(self.buffer) + '\n')
+            self.buffer = []
+        self.fp.flush()
+
+    def close(self) -> None:
+        self.log("close", written=self.written + 1, dropped=self.dropped)
+        self.flush()
+        self.fp.close()
+
+
+def encode_individual(individual : 'Individual') -> 'list[list]':
+    """
+    Index encoding of the rules of an individual.
+    """
+    return [[r.head, r.body] for r in individual.rules]
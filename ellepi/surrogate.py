@@ -0,0 +1,153 @@
+import math
+
+import numpy as np
+
+from typing import TYPE_CHECKING
+
+from .variable_placer import Atom
+
+if TYPE_CHECKING:
+    from .genetic import Individual
+
+
+class Surrogate:
+    """
+    Lightweight surrogate model to predict the score of an individual
+    without calling Prolog.
+    It is a linear regression over the counts of the head and body atoms
+    (and of their instantiations) of the rules of the individual, trained
+    online (AdaGrad) every time a real score is available.
+    """
+    def __init__(self,
+            head_candidates : 'list[Atom]',
+            body_candidates : 'list[Atom]',
+            keep_fraction : float = 0.5,
+            min_samples : int = 50,
+            learning_rate : float = 0.1,
+            l2 : float = 1e-4
+        ) -> None:
+        self.keep_fraction = keep_fraction
+        self.min_samples = min_samples
+        self.learning_rate = learning_rate
+        self.l2 = l2
+
+        # offsets of the features: instantiations of the head atoms,
+        # instantiations of the body atoms, body atoms, then bias,
+        # number of rules and number of body atoms
+        self.head_offsets : 'list[int]' = []
+        self.body_offsets : 'list[int]' = []
+        current = 0
+        for a in head_candidates:
+            self.head_offsets.append(current)
+            current += len(a.possible_instantiations)
+        for a in body_candidates:
+            self.body_offsets.append(current)
+            current += len(a.possible_instantiations)
+        self.body_atom_offset = current
+        current += len(body_candidates)
+        self.bias_index = current
+        self.n_features = current + 3
+
+        self.weights = np.zeros(self.n_features)
+        self.squared_gradients = np.zeros(self.n_features)
+
+        # running mean and variance of the scores (Welford), to train on
+        # standardized targets
+        self.n_samples : int = 0
+        self.mean_score : float = 0
+        self.m2_score : float = 0
+
+        # statistics
+        self.filtered : int = 0 # offspring that went through the filter
+        self.skipped : int = 0 # evaluations saved
+        self.selected : int = 0 # offspring selected by the surrogate
+        self.selected_good : int = 0 # of which entered the population
+
+    def _get_features(self, individual : 'Individual') -> 'tuple[np.ndarray, np.ndarray]':
+        """
+        Sparse feature vector (indices and values) of an individual.
+        """
+        features : 'dict[int, float]' = {}
+        n_body_atoms = 0
+        for r in individual.rules:
+            idx = self.head_offsets[r.head[0]] + r.head[1]
+            features[idx] = features.get(idx, 0) + 1
+            for a in r.body:
+                idx = self.body_offsets[a[0]] + a[1]
+                features[idx] = features.get(idx, 0) + 1
+                idx = self.body_atom_offset + a[0]
+                features[idx] = features.get(idx, 0) + 1
+            n_body_atoms += len(r.body)
+        features[self.bias_index] = 1
+        features[self.bias_index + 1] = len(individual.rules)
+        features[self.bias_index + 2] = n_body_atoms
+
+        indices = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+        values = np.fromiter(features.values(), dtype=np.float64, count=len(features))
+        return indices, values
+
+    def _get_std(self) -> float:
+        if self.n_samples < 2:
+            return 1
+        return max(math.sqrt(self.m2_score / (self.n_samples - 1)), 1e-9)
+
+    def predict(self, individual : 'Individual') -> float:
+        """
+        Predicted score of an individual.
+        """
+        indices, values = self._get_features(individual)
+        z = float(np.dot(self.weights[indices], values))
+        return z * self._get_std() + self.mean_score
+
+    def update(self, individual : 'Individual', score : float) -> None:
+        """
+        Trains the model with the real score of an individual.
+        """
+        self.n_samples += 1
+        delta = score - self.mean_score
+        self.mean_score += delta / self.n_samples
+        self.m2_score += delta * (score - self.mean_score)
+
+        indices, values = self._get_features(individual)
+        target = (score - self.mean_score) / self._get_std()
+        error = float(np.dot(self.weights[indices], values)) - target
+        gradient = error * values + self.l2 * self.weights[indices]
+        self.squared_gradients[indices] += gradient * gradient
+        self.weights[indices] -= self.learning_rate * gradient / np.sqrt(self.squared_gradients[indices] + 1e-8)
+
+    def is_trained(self) -> bool:
+        return self.n_samples >= self.min_samples
+
+    def select(self, individuals : 'list[Individual]') -> 'list[Individual]':
+        """
+        Returns the fraction of the individuals predicted to be the best.
+        All the individuals are returned until the model has seen enough
+        samples.
+        """
+        if not self.is_trained() or len(individuals) == 0:
+            return individuals
+
+        n_keep = max(1, math.ceil(self.keep_fraction * len(individuals)))
+        predictions = [self.predict(i) for i in individuals]
+        order = sorted(range(len(individuals)), key=lambda idx : predictions[idx], reverse=True)
+        selected = [individuals[idx] for idx in sorted(order[:n_keep])]
+
+        self.filtered += len(individuals)
+        self.skipped += len(individuals) - len(selected)
+        self.selected += len(selected)
+        return selected
+
+    def record_outcome(self, individual : 'Individual', worst_score : float) -> None:
+        """
+        Records whether an individual selected by the surrogate would
+        enter the population (score at least as the worst one), to
+        compute the precision of the model.
+        """
+        if individual.score >= worst_score:
+            self.selected_good += 1
+
+    def get_precision(self) -> float:
+        return self.selected_good / self.selected if self.selected > 0 else 0
+
+    def __str__(self) -> str:
+        return f"Surrogate: trained on {self.n_samples}, evaluations saved: {self.skipped}/{self.filtered}, precision: {self.get_precision():.3f}"
@@ -1,4 +1,5 @@
 import itertools as it
+import math
 
 class Atom:
     """
@@ -14,6 +15,11 @@ class Atom:
         self.arity = len(modes)
         self.number_of_variables = nvars
         self.possible_instantiations : 'list[str]' = []
+        # arguments of each instantiation and index of each tuple of
+        # arguments, to rename the variables of a rule (RuleNormaliser)
+        self.instantiation_arguments : 'list[tuple[str, ...]]' = []
+        self.instantiation_index : 'dict[tuple[str, ...], int]' = {}
+        self.variables : 'set[str]' = {'A'+f"{i}" for i in range(nvars)}
         
         self._place_variables()
     
@@ -68,4 +74,125 @@ class Atom:
                         idx_var += 1
                 
                 inst += "(" + ','.join(lv) + ")"
-            self.possible_instantiations.append(inst)
\ No newline at end of file
+            else:
+                lv = []
+            self.instantiation_index[tuple(lv)] = len(self.possible_instantiations)
+            self.instantiation_arguments.append(tuple(lv))
+            self.possible_instantiations.append(inst)
+
+
+class RuleNormaliser:
+    """
+    Maps a rule (indices of the head and body atoms and of their
+    instantiations, as in genetic.Rule) to a canonical representative
+    of its alpha-equivalence class: the variables are renamed A0, A1, ...
+    in order of first occurrence, reading the head and then the body
+    atoms sorted by index. So p(A0) :- q(A0,A1) and p(A1) :- q(A1,A0)
+    get the same indices. When the same atom occurs more than once in
+    the body, all the orderings of its occurrences (at most
+    max_permutations overall) are tried and the smallest encoding is
+    taken.
+    The observed collapse ratio is estimated on the first max_observed
+    distinct rules, so the memory used does not grow with the run.
+    """
+    def __init__(self,
+            head_candidates : 'list[Atom]',
+            body_candidates : 'list[Atom]',
+            max_permutations : int = 24,
+            max_observed : int = 100000
+        ) -> None:
+        self.head_candidates = head_candidates
+        self.body_candidates = body_candidates
+        self.max_permutations = max_permutations
+        self.max_observed = max_observed
+        # rules seen before and after the normalisation
+        self.raw_rules : 'set[tuple]' = set()
+        self.canonical_rules : 'set[tuple]' = set()
+
+    def _rename(self, atoms : 'list[tuple[Atom, int]]') -> 'list[int]':
+        """
+        Instantiation indices of the atoms after renaming the variables
+        in order of first occurrence.
+        """
+        mapping : 'dict[str, str]' = {}
+        renamed : 'list[int]' = []
+        for atom, inst in atoms:
+            new_arguments : 'list[str]' = []
+            for a in atom.instantiation_arguments[inst]:
+                if a in atom.variables:
+                    if a not in mapping:
+                        mapping[a] = 'A'+f"{len(mapping)}"
+                    new_arguments.append(mapping[a])
+                else:
+                    new_arguments.append(a)
+            renamed.append(atom.instantiation_index[tuple(new_arguments)])
+        return renamed
+
+    def _get_orderings(self, body : 'list[list[int]]') -> 'list[list[list[int]]]':
+        """
+        Orderings of the body to try: sorted by atom index, permuting the
+        occurrences of the same atom.
+        """
+        body = sorted(body)
+        groups = [list(g) for _, g in it.groupby(body, key=lambda x : x[0])]
+        n_orderings = 1
+        for g in groups:
+            n_orderings *= math.factorial(len(g))
+        if n_orderings == 1 or n_orderings > self.max_permutations:
+            return [body]
+        orderings : 'list[list[list[int]]]' = []
+        for p in it.product(*[it.permutations(g) for g in groups]):
+            orderings.append([a for g in p for a in g])
+        return orderings
+
+    def normalise(self, head : 'list[int]', body : 'list[list[int]]') -> 'tuple[list[int], list[list[int]]]':
+        """
+        Canonical head and body (sorted by atom and instantiation).
+        """
+        best : 'tuple | None' = None
+        for ordering in self._get_orderings(body):
+            atoms = [(self.head_candidates[head[0]], head[1])] + [(self.body_candidates[a], i) for a, i in ordering]
+            renamed = self._rename(atoms)
+            new_body = sorted((a[0], i) for a, i in zip(ordering, renamed[1:]))
+            encoding = (renamed[0], tuple(new_body))
+            if best is None or encoding < best:
+                best = encoding
+
+        new_head = [head[0], best[0]]
+        new_body = [list(a) for a in best[1]]
+        if len(self.raw_rules) < self.max_observed:
+            self.raw_rules.add((tuple(head), tuple(sorted(tuple(a) for a in body))))
+            self.canonical_rules.add((tuple(new_head), best[1]))
+        return new_head, new_body
+
+    def clear_observed(self) -> None:
+        """
+        Forgets the observed rules (the collapse ratio is then estimated
+        on the rules seen from now on).
+        """
+        self.raw_rules.clear()
+        self.canonical_rules.clear()
+
+    def get_observed_collapse_ratio(self) -> float:
+        """
+        Distinct rules seen / distinct canonical rules.
+        """
+        if len(self.canonical_rules) == 0:
+            return 1
+        return len(self.raw_rules) / len(self.canonical_rules)
+
+    def get_single_atom_collapse_ratio(self) -> float:
+        """
+        Exact collapse ratio of the space of the rules with one body atom:
+        number of rules / number of canonical rules.
+        """
+        canonical : 'set[tuple]' = set()
+        n_rules = 0
+        for h, head_atom in enumerate(self.head_candidates):
+            for hi in range(len(head_atom.possible_instantiations)):
+                for b, body_atom in enumerate(self.body_candidates):
+                    for bi in range(len(body_atom.possible_instantiations)):
+                        renamed = self._rename([(head_atom, hi), (body_atom, bi)])
+                        canonical.add((h, renamed[0], b, renamed[1]))
+                        n_rules += 1
+        return n_rules / len(canonical) if len(canonical) > 0 else 1